@@ -5,16 +5,55 @@ import sys
 import getopt
 import textwrap
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from .core import Contest, create_layout_for_contest
 from .core import Problem, create_layout_for_problem
-from .core import OcimaticException
+from .core import OcimaticException, TaskResult
+from .core import run_formatter, run_status, check_formatter, check_status
+from . import server
+from . import source
+from . import distributed
+from . import scheduler
+from . import planner
+from . import history
+from . import results
+from . import trace
 
 OPTS = {
     'partial': False,
     'problem': None,
     'sample': False,
+    'trace': None,
+    'jobs': None,
+    'cases': 1000,
+    'max_size': 100,
+    'coordinator': None,
+    'local_workers': 0,
+    'test_major': False,
+    'force': False,
+    'drop': False,
+    'plan': False,
+    'shard': None,
+    'results': None,
 }
 
+SHORT_OPTS = 'hp:j:'
+LONG_OPTS = ['help', 'partial', 'problem=', 'phase=', 'sample', 'no-server',
+             'trace=', 'jobs=', 'cases=', 'max-size=', 'coordinator=',
+             'local-workers=', 'test-major', 'force',
+             'drop', 'plan', 'shard=', 'results=']
+
+# When running inside the resident server (see server.py) this holds a
+# `server.ModelCache` so contest and problems are loaded only once.
+MODEL_CACHE = None
+
+
+def load_model(cls, path, *args):
+    if MODEL_CACHE is None:
+        return cls(path, *args)
+    return MODEL_CACHE.get(cls, path, *args)
+
 RESET = '\x1b[0m'
 BOLD = '\x1b[1m'
 UNDERLINE = '\x1b[4m'
@@ -167,7 +206,28 @@ def ocimatic_help():
                 ' given name.')
     indent(1, bold('pdf'))
     description(2, 'Merge the statements of all problems generating a'
-                ' problemset pdf.')
+                ' problemset pdf. EPS figures are converted to PDF in'
+                ' parallel before LaTeX runs and cached by content in ' +
+                bold('.ocimatic-cache/figures') + ' at the contest root, so'
+                ' each figure is converted once.')
+    indent(1, bold('server') + ' ' + underline('[stop]'))
+    description(2, 'Start a resident server for the contest that keeps the'
+                ' contest loaded in memory. While it is running every'
+                ' ocimatic call inside the contest is executed by the server.'
+                ' The server runs in the foreground until it receives ' +
+                bold('ocimatic contest server stop') + '.')
+    indent(1, bold('worker') + ' ' + underline('HOST:PORT'))
+    description(2, 'Run jobs for the coordinator listening at ' +
+                underline('HOST:PORT') + ' until it finishes (see ' +
+                bold('--coordinator') + '). It doesn\'t need to be called'
+                ' inside a contest. Files are fetched on demand and cached'
+                ' in ~/.cache/ocimatic/blobs.')
+    indent(1, bold('bench'))
+    description(2, 'Measure the overhead added by ocimatic when running'
+                ' solutions: the time to launch a process with posix_spawn,'
+                ' which is used to run solutions, against forking ocimatic,'
+                ' and the round-trip latency of each interaction in'
+                ' interactive problems.')
     writeln()
 
     header('PROBLEM ACTIONS')
@@ -177,7 +237,9 @@ def ocimatic_help():
     description(2, 'Generate expected output files (*.sol) for all input'
                 ' testdata (*.in) using any correct solution.')
     indent(1, bold('pdf'))
-    description(2, 'Generates pdf file for the problem statement.')
+    description(2, 'Generates pdf file for the problem statement. Figures are'
+                ' converted beforehand as in the contest ' + bold('pdf') +
+                ' action.')
     indent(1, bold('check'))
     description(2, 'Checks input/output running all correct solutions with all'
                 ' testdata and sample inputs.'
@@ -186,13 +248,157 @@ def ocimatic_help():
     indent(1, bold('run'))
     description(2, 'Run solutions with all test data and display the output'
                 ' of the checker. It compiles solutions if no binary is present'
-                ' or when binary is older than source file.')
+                ' or when binary is older than source file. If the problem'
+                ' has a ' + bold('managers/interactor') + ' it is interactive:'
+                ' the solution and the interactor are connected through pipes'
+                ' and the interactor is called with the paths of the input,'
+                ' the expected output and a file where it must write the'
+                ' score. Only the time of the solution is reported.')
+    description(2, 'Solutions of all problems are compiled in parallel and'
+                ' the tests of each solution start as soon as it is built,'
+                ' while the rest keep compiling. Tests are still run one at'
+                ' a time and results are shown in the usual order. With ' +
+                bold('-j 1') + ' or ' + bold('--test-major') + ' solutions are'
+                ' built on first use instead. This also applies to ' +
+                bold('check') + '.')
     indent(1, bold('build'))
-    description(2, 'Build all correct and partial solutions.')
+    description(2, 'Build all correct and partial solutions of all problems'
+                ' in parallel. A C++ grader (' + bold('managers/grader.cpp') +
+                ') is compiled once per problem, together with precompiled'
+                ' headers for the headers in ' + bold('managers') + ', and'
+                ' linked into each solution.')
     indent(1, bold('normalize'))
     description(2, 'Normalize input (*.in) and expected (*.sol) files.')
     indent(1, bold('compress'))
-    description(2, 'Compress testdata (*.in and *.sol) in a .zip file.')
+    description(2, 'Compress testdata (*.in and *.sol) in a .zip file.'
+                ' Compressed tests are stored uncompressed inside the zip.')
+    description(2, 'Inputs and expected outputs may be stored compressed with'
+                ' gzip, xz or zstd (e.g. ' + bold('1.in.gz') + ', ' +
+                bold('1.sol.xz') + ', ' + bold('1.in.zst') + '). They are'
+                ' never expanded on disk: solutions read them from a pipe'
+                ' fed by the decompressor, and checkers and interactors get'
+                ' the path of such a pipe, so they must read each file once'
+                ' from start to end. ' + bold('expected') + ' compresses the'
+                ' outputs of compressed inputs in the same format and ' +
+                bold('normalize') + ' leaves compressed files untouched.')
+    indent(1, bold('dedupe'))
+    description(2, 'Report tests with identical inputs and tests whose inputs'
+                ' are at least 90% similar (estimated Jaccard similarity of'
+                ' sequences of tokens). Files are read in a single streaming'
+                ' pass. With ' + bold('--drop') + ' identical tests in the'
+                ' same subtask (subdirectory of the testdata) are deleted'
+                ' keeping the first of each group; identical tests in'
+                ' different subtasks are only reported.')
+    indent(1, bold('stats') + ' ' + underline('[QUERY [N]]'))
+    description(2, 'Show the size, number of lines and number of tokens of'
+                ' every input, and with ' + underline('QUERY') + ' ' +
+                bold('largest') + ' the ' + underline('N') + ' (default 3)'
+                ' largest inputs of each subtask (subdirectory of the'
+                ' testdata), or with ' + bold('bounds') + ', for each'
+                ' column of numbers, the inputs whose values are within ' +
+                underline('N') + '% (default 5) of the minimum or maximum of'
+                ' the dataset. The first line of an input is told apart from'
+                ' the rest. Each input is read once and its statistics are'
+                ' kept in ' + bold('.ocimatic-stats.json') + ' in the'
+                ' testdata directory until it changes. The planner and ' +
+                bold('complexity') + ' use the sizes recorded there.')
+    indent(1, bold('merge') + ' ' + underline('FILE...'))
+    description(2, 'Combine the results written with ' + bold('--results') +
+                ' by the shards of a run, report the failures, and exit'
+                ' with status 1 if a correct solution failed on some test or'
+                ' shards are missing. Paths are relative to the current'
+                ' directory, which doesn\'t need to be in a contest.')
+    indent(1, bold('history'))
+    description(2, 'List previous executions of ' + bold('run') + ' and ' +
+                bold('check') + '. Every result (verdict, cpu and wall time,'
+                ' peak memory, hashes of the binary and the input) is'
+                ' recorded in ' +
+                bold(history.DB_NAME) + ' at the contest root.')
+    indent(1, bold('compare') + ' ' + underline('[BASELINE [RUN]]'))
+    description(2, 'Compare the times of each solution in run ' +
+                underline('RUN') + ' (by default the last one) against ' +
+                underline('BASELINE') + ' (by default the previous run of the'
+                ' same action), pairing tests by input. Statistically'
+                ' significant slowdowns are reported as failures.')
+    indent(1, bold('stress'))
+    description(2, 'Run every correct and partial solution against the first'
+                ' correct solution on random inputs, in parallel, stopping at'
+                ' the first disagreement. Inputs are produced by the generator'
+                ' in ' + bold('managers/generator.*') + ', which is called'
+                ' with a seed and a size and must print the input. The failing'
+                ' case is shrunk to the smallest size that still fails and'
+                ' saved in the testdata directory. Seeds start at a random'
+                ' base, so every invocation tries new cases, and the seed and'
+                ' size of the saved case are shown so the generator can'
+                ' reproduce it. See ' + bold('--cases') +
+                ' and ' + bold('--max-size') + '.')
+    indent(1, bold('complexity'))
+    description(2, 'Time every correct solution (and partial ones with ' +
+                bold('--partial') + ') on inputs of increasing size and'
+                ' report the growth curve that fits the times best, among'
+                ' 1, log n, n, n log n, n^2, n^2 log n, n^3 and 2^n (least'
+                ' squares fit of a + b f(n)); a faster-growing curve is only'
+                ' reported if it fits significantly better, and solutions'
+                ' whose times differ by less than 2 ms are reported as too'
+                ' fast to measure. Inputs are produced by the'
+                ' generator with about 8 sizes up to ' + bold('--max-size') +
+                ', and the time is extrapolated to the ' + bold('max_n') +
+                ' option of the problem. Without a generator the tests of'
+                ' the dataset are used, n is the size of the input in bytes,'
+                ' and the time is extrapolated to ' + bold('max_input') +
+                '. Each time is the minimum CPU time of 3 runs.')
+    writeln()
+
+    header('PROBLEM CONFIGURATION')
+    description(1, 'Problems can be configured in their ' + bold('.problem') +
+                ' file using ' + underline('key') + ' = ' + underline('value') +
+                ' lines. Lines starting with # are ignored.')
+    writeln()
+    indent(1, bold('checker') + ' = persistent')
+    description(2, 'Start ' + bold('managers/checker') + ' once and reuse it'
+                ' for every test. For each test the checker receives three'
+                ' lines on its standard input with the paths of the input,'
+                ' the expected output and the output of the solution, and'
+                ' must print a line with the score. By default the checker'
+                ' is called once per test with the three paths as arguments'
+                ' and writes the score to its standard output.')
+    indent(1, bold('max_n') + ' = ' + underline('N'))
+    description(2, 'Size passed to the generator that produces the largest'
+                ' inputs allowed by the constraints. ' + bold('complexity') +
+                ' extrapolates the time of solutions to it.')
+    indent(1, bold('max_input') + ' = ' + underline('BYTES'))
+    description(2, 'Size of the largest input allowed by the constraints,'
+                ' used by ' + bold('complexity') + ' when the problem has no'
+                ' generator.')
+    indent(1, bold('memory') + ' = ' + underline('MB'))
+    description(2, 'Memory limit of solutions in megabytes. The data segment'
+                ' of each solution is limited to it, and solutions that use'
+                ' more memory (peak resident set size) or fail to allocate it'
+                ' get a Memory Limit Exceeded verdict. The peak memory of'
+                ' every run is shown next to its time and recorded in the'
+                ' history whether or not a limit is set. Solutions are'
+                ' started through a small launcher (compiled once with ' +
+                bold('cc') + ') so their own peak memory is measured. If it'
+                ' can\'t be compiled, Linux accounts the resident memory of'
+                ' ocimatic itself (about 20 MB) to the processes it starts, so'
+                ' peaks below that aren\'t known: they aren\'t shown and'
+                ' aren\'t held against the limit.')
+    indent(1, bold('output') + ' = ' + underline('MB'))
+    description(2, 'Output limit of solutions in megabytes. The output of'
+                ' solutions is read through a pipe and a solution that'
+                ' writes more is killed with an Output Limit Exceeded'
+                ' verdict. Defaults to 64 MB or twice the size of the'
+                ' expected output, whichever is larger (64 MB for'
+                ' compressed expected outputs). Without a custom checker the'
+                ' output is compared with the expected one while it is'
+                ' written, and the solution is stopped at the first'
+                ' difference.')
+    indent(1, bold('python') + ' = ' + underline('INTERPRETER'))
+    description(2, 'Interpreter used for Python solutions (*.py), for'
+                ' example pypy3. Defaults to python3. Solutions are'
+                ' compiled to bytecode when built, and the startup time of'
+                ' the interpreter is measured once and reported apart from'
+                ' the time of each test.')
     writeln()
 
     header('OPTIONS')
@@ -213,6 +419,93 @@ def ocimatic_help():
     description(2, 'By default the action ' + bold('expected') + ' does not'
                 ' generate sample outputs. Use this option to consider samples.')
     writeln()
+    indent(1, bold('-j, --jobs') + '=' + underline('N'))
+    description(2, 'Number of parallel jobs (builds for ' + bold('run') +
+                ' and ' + bold('check') + '). Defaults to the number of'
+                ' CPUs.')
+    writeln()
+    indent(1, bold('--cases') + '=' + underline('N'))
+    description(2, 'Number of random cases generated by ' + bold('stress') +
+                ' (default 1000).')
+    writeln()
+    indent(1, bold('--max-size') + '=' + underline('N'))
+    description(2, 'Maximum size passed to the generator by ' +
+                bold('stress') + ' and ' + bold('complexity') +
+                ' (default 100).')
+    writeln()
+    indent(1, bold('--coordinator') + '=' + underline('HOST:PORT'))
+    description(2, 'Distribute the actions ' + bold('run') + ' and ' +
+                bold('check') + ' among workers (see ' +
+                bold('contest worker') + '). Solutions are built locally and'
+                ' workers connecting to ' + underline('HOST:PORT') + ' pull'
+                ' one test at a time. Workers must be able to run binaries'
+                ' built on this machine. Interactive problems and Java'
+                ' solutions are run locally.')
+    writeln()
+    indent(1, bold('--local-workers') + '=' + underline('N'))
+    description(2, 'Also start ' + underline('N') + ' workers on this'
+                ' machine when using ' + bold('--coordinator') + '.')
+    writeln()
+    indent(1, bold('--force'))
+    description(2, 'Each testdata directory keeps a manifest with the hash of'
+                ' every file, so ' + bold('expected') + ', ' + bold('check') +
+                ', ' + bold('normalize') + ' and ' + bold('compress') +
+                ' only process tests added or changed since they last ran'
+                ' (or everything if the solutions or the checker changed).'
+                ' Use this option to process every test.')
+    writeln()
+    indent(1, bold('--drop'))
+    description(2, 'Make ' + bold('dedupe') + ' delete tests duplicated'
+                ' within a subtask.')
+    writeln()
+    indent(1, bold('--test-major'))
+    description(2, 'Make ' + bold('run') + ' and ' + bold('check') + ' run'
+                ' all solutions on a test before moving to the next one. Each'
+                ' input is read from disk once and fed to every solution'
+                ' through a pipe. Results are displayed at the end.')
+    writeln()
+    indent(1, bold('--plan'))
+    description(2, 'Instead of running ' + bold('run') + ' or ' +
+                bold('check') + ', print the predicted time of each solution'
+                ' and the predicted wall time of the whole run. The cost of'
+                ' running a solution on a test is its last time in the'
+                ' history, or else an estimate from the size of the input.'
+                ' With ' + bold('--coordinator') + ' jobs are always handed'
+                ' to workers longest first, which keeps one slow problem from'
+                ' stretching the end of the run. With ' +
+                bold('--coordinator') + ' the prediction assumes the number'
+                ' of ' + bold('--local-workers') + ' or ' + bold('--jobs') +
+                '. Without it tests are judged one at a time, so only the'
+                ' sequential time is predicted.')
+    writeln()
+    indent(1, bold('--shard') + '=' + underline('I/N'))
+    description(2, 'Make ' + bold('run') + ' and ' + bold('check') + ' only'
+                ' process shard ' + underline('I') + ' of ' + underline('N') +
+                ', to split the work among several machines (e.g. CI jobs)'
+                ' running the same command. Every (problem, solution, test)'
+                ' belongs to exactly one shard. Shards are balanced by the'
+                ' size of the inputs, largest first, and only depend on the'
+                ' files of the contest, so every machine computes the same'
+                ' shards without coordination. ' + bold('check') + ' doesn\'t'
+                ' record checked tests in the manifest when sharded.')
+    writeln()
+    indent(1, bold('--results') + '=' + underline('FILE'))
+    description(2, 'Write the result of every solution on every test run by ' +
+                bold('run') + ' or ' + bold('check') + ' (verdict, cpu time,'
+                ' peak memory) to ' + underline('FILE') + ' in JSON, with'
+                ' paths relative to the contest root. With ' + bold('merge') +
+                ', write the merged results.')
+    writeln()
+    indent(1, bold('--trace') + '=' + underline('FILE'))
+    description(2, 'Record the time spent compiling, running solutions,'
+                ' checking outputs and generating pdfs, and write it to ' +
+                underline('FILE') + ' in Chrome trace-event format (open it'
+                ' in chrome://tracing or Perfetto). A summary of the main'
+                ' time sinks is printed at exit.')
+    writeln()
+    indent(1, bold('--no-server'))
+    description(2, 'Do not forward the command to a running server.')
+    writeln()
     sys.exit(1)
 
 
@@ -252,7 +545,43 @@ def new_contest(args):
 
 def contest_pdf(contest, _):
     start_task('Generating problemset')
-    end_task(contest.gen_problemset_pdf())
+    end_task(contest.gen_problemset_pdf(OPTS['jobs']))
+
+
+def contest_server(contest, args):
+    if args and args[0] == 'stop':
+        if server.stop(contest.path()):
+            show_message('Info', 'Server stopped')
+        else:
+            show_message('Warning', 'No server running', WARNING)
+        return
+    show_message('Info', 'Serving contest at %s' % server.socket_path(contest.path()))
+    try:
+        server.Server(contest.path()).serve()
+    except RuntimeError as exc:
+        error_message(str(exc))
+    except KeyboardInterrupt:
+        pass
+
+
+def contest_bench(contest, _):
+    start_task('Launch with fork')
+    end_task(TaskResult('%.1f us' % (source.launch_overhead(source.fork_spawn)
+                                     * 1e6)))
+    start_task('Launch with posix_spawn')
+    end_task(TaskResult('%.1f us' % (source.launch_overhead(source.spawn)
+                                     * 1e6)))
+    start_task('Pipe round-trip per interaction')
+    end_task(TaskResult('%.1f us' % (source.pipe_round_trip() * 1e6)))
+
+
+def contest_worker(args):
+    if len(args) < 1:
+        error_message('You have to specify the address of the coordinator.')
+    try:
+        distributed.Worker(args[0]).work()
+    except (OSError, ValueError) as exc:
+        error_message('Worker failed: %s' % exc)
 
 
 def contest_mode(args):
@@ -261,13 +590,17 @@ def contest_mode(args):
 
     actions = {
         'pdf': contest_pdf,
+        'server': contest_server,
+        'bench': contest_bench,
     }
 
     if args[0] == "new":
         new_contest(args[1:])
+    elif args[0] == "worker":
+        contest_worker(args[1:])
     elif args[0] in actions:
         change_directory()
-        contest = Contest(os.getcwd())
+        contest = load_model(Contest, os.getcwd())
         actions[args[0]](contest, args[1:])
     else:
         error_message('Unknown action for contest.')
@@ -285,26 +618,154 @@ def new_problem(args):
 
 
 def problems_build(problems, _):
-    for problem in problems:
-        task_header(problem, "Building solutions")
-        problem.build_all(start_task, end_task)
+    with ThreadPoolExecutor(OPTS['jobs']) as executor:
+        builds = [problem.schedule_build(executor) for problem in problems]
+        for problem, problem_builds in zip(problems, builds):
+            task_header(problem, "Building solutions")
+            problem.build_all(start_task, end_task, problem_builds)
 
 
 def gen_sol_files(problems, _):
     for problem in problems:
         task_header(problem, "Generating expected solutions for testdata")
-        problem.gen_solutions_for_dataset(start_task, end_task, OPTS['sample'])
+        problem.gen_solutions_for_dataset(start_task, end_task, OPTS['sample'],
+                                          OPTS['force'])
+
+
+def make_planner(problems):
+    times = {}
+    db_path = os.path.join(os.getcwd(), history.DB_NAME)
+    if os.path.isfile(db_path):
+        db = history.History(db_path)
+        times = db.latest_times([problem.name() for problem in problems])
+        db.close()
+    return planner.Planner(times)
+
+
+def plan_workers():
+    """Number of workers judging at the same time. Without a coordinator
+    tests are judged one at a time (see scheduler.py)."""
+    if not OPTS['coordinator']:
+        return 1
+    return OPTS['local_workers'] or OPTS['jobs'] or os.cpu_count() or 1
+
+
+def all_jobs(problems, partial, sample):
+    return [(problem, solution, test) for problem in problems
+            for solution in problem.solutions(partial)
+            for test in problem.tests(sample)]
+
+
+def apply_shard(problems, action):
+    """Restrict problems to the jobs of the shard given with --shard, or to
+    every job without it. Shards are balanced by the size of the inputs, not
+    by the history, so every machine computes the same shards."""
+    if not OPTS['shard']:
+        for problem in problems:
+            problem.restrict()
+        return
+    index, count = OPTS['shard']
+    jobs = planner.by_size(all_jobs(problems,
+                                    OPTS['partial'] and action == 'run',
+                                    action == 'check'))
+    key = lambda job: (job.problem.name(),
+                       job.problem.solution_key(job.solution),
+                       os.path.relpath(str(job.test)))
+    own = planner.shard(jobs, count, key)[index - 1]
+    for problem in problems:
+        problem.restrict([(job.solution, job.test) for job in own
+                          if job.problem is problem])
+
+
+def show_plan(problems, partial, sample):
+    jobs = [job for job in all_jobs(problems, partial, sample)
+            if job[0].selected(job[1], job[2])]
+    planned = make_planner(problems).plan(jobs)
+    for problem in problems:
+        task_header(problem, 'Planning')
+        for solution in problem.solutions(partial):
+            own = [job for job in planned
+                   if job.problem is problem and job.solution is solution]
+            start_task(str(solution))
+            end_task(TaskResult('%.3f [%d/%d from history]' %
+                                (sum(job.cost for job in own),
+                                 len([job for job in own if job.known]),
+                                 len(own))))
+    workers = plan_workers()
+    writeln()
+    header('Predicted wall time')
+    start_task('Sequential')
+    end_task(TaskResult('%.3f' % sum(job.cost for job in planned)))
+    if workers == 1:
+        # Tests are judged one at a time, the order makes no difference.
+        start_task('Order')
+        end_task(TaskResult('No effect without --coordinator'))
+        return
+    start_task('Directory order on %d workers' % workers)
+    end_task(TaskResult('%.3f' % planner.makespan(planned, workers)))
+    start_task('Longest first on %d workers' % workers)
+    end_task(TaskResult('%.3f' % planner.makespan(
+        planner.longest_first(planned), workers)))
+
+
+def distribute(problems, partial, sample, formatter, status_fun):
+    coordinator = distributed.Coordinator(OPTS['coordinator'],
+                                          OPTS['local_workers'],
+                                          make_planner(problems))
+    coordinator.run(problems,
+                    lambda problem, solution:
+                    task_header(problem, "Checking %s" % solution),
+                    start_task, end_task, partial, sample, formatter,
+                    status_fun)
+
+
+def pipelined():
+    """Whether to overlap builds with runs instead of running solutions one
+    after the other building them on first use."""
+    return not OPTS['test_major'] and OPTS['jobs'] != 1
+
+
+def pipeline(problems, partial, sample, formatter, status_fun, skips=None):
+    return scheduler.Pipeline(OPTS['jobs']).run(
+        problems,
+        lambda problem, solution:
+        task_header(problem, "Checking %s" % solution),
+        start_task, end_task, partial, sample, formatter, status_fun, skips)
 
 
 def problems_check(problems, _):
+    if OPTS['plan']:
+        show_plan(problems, False, True)
+        return
+    if OPTS['coordinator']:
+        distribute(problems, False, True, check_formatter, check_status)
+        return
+    if pipelined():
+        skips = dict((problem, problem.unchanged_tests(OPTS['force']))
+                     for problem in problems)
+        passed = pipeline(problems, False, True, check_formatter,
+                          check_status, skips)
+        for problem in problems:
+            problem.mark_checked(passed[problem], skips[problem])
+        return
     for problem in problems:
         problem.check(
             (lambda problem:
              lambda solution: task_header(problem, "Checking %s" % solution))(problem),
-            start_task, end_task)
+            start_task, end_task, test_major=OPTS['test_major'],
+            force=OPTS['force'])
 
 
 def problems_run(problems, _):
+    if OPTS['plan']:
+        show_plan(problems, OPTS['partial'], False)
+        return
+    if OPTS['coordinator']:
+        distribute(problems, OPTS['partial'], False, run_formatter, run_status)
+        return
+    if pipelined():
+        pipeline(problems, OPTS['partial'], False, run_formatter, run_status)
+        return
     for problem in problems:
         problem.run(
             (lambda problem:
@@ -313,10 +774,17 @@ def problems_run(problems, _):
             start_task,
             end_task,
             OPTS['partial'],
+            test_major=OPTS['test_major'],
         )
 
 
 def problems_pdf(problems, _):
+    contest = load_model(Contest, os.getcwd())
+    failed = contest.convert_figures([problem.statement()
+                                      for problem in problems], OPTS['jobs'])
+    for figure in failed:
+        start_task(figure)
+        end_task(TaskResult('Conversion failed', False))
     for problem in problems:
         task_header(problem, "Generating pdf file")
         problem.gen_pdf(start_task, end_task)
@@ -325,13 +793,145 @@ def problems_pdf(problems, _):
 def problems_compress(problems, _):
     for problem in problems:
         task_header(problem, "Compressing test data")
-        problem.compress()
+        start_task('data.zip')
+        if problem.compress(OPTS['force']):
+            end_task(TaskResult('OK'))
+        else:
+            end_task(TaskResult('Up to date'))
 
 
 def problems_normalize(problems, _):
     for problem in problems:
         task_header(problem, "Normalizing test data")
-        problem.normalize()
+        problem.normalize(OPTS['force'])
+
+def problems_stress(problems, _):
+    for problem in problems:
+        task_header(problem, "Stress testing solutions")
+        try:
+            problem.stress(start_task, end_task, OPTS['cases'],
+                           OPTS['max_size'], OPTS['jobs'])
+        except OcimaticException as exc:
+            start_task(str(problem))
+            end_task(TaskResult(str(exc), False))
+
+
+def problems_complexity(problems, _):
+    for problem in problems:
+        task_header(problem, "Estimating complexity")
+        try:
+            problem.complexity(
+                (lambda problem:
+                 lambda solution:
+                 task_header(problem, "Timing %s" % solution))(problem),
+                start_task, end_task, OPTS['partial'], OPTS['max_size'])
+        except OcimaticException as exc:
+            start_task(str(problem))
+            end_task(TaskResult(str(exc), False))
+
+
+def problems_stats(problems, args):
+    query = args[0] if args else None
+    try:
+        arg = int(args[1]) if len(args) > 1 else None
+    except ValueError:
+        error_message('Expected a number instead of `%s`.' % args[1])
+    for problem in problems:
+        task_header(problem, "Test data statistics")
+        try:
+            problem.stats(start_task, end_task, query, arg)
+        except OcimaticException as exc:
+            start_task(str(problem))
+            end_task(TaskResult(str(exc), False))
+
+
+def open_history():
+    db_path = os.path.join(os.getcwd(), history.DB_NAME)
+    if not os.path.isfile(db_path):
+        error_message('No run history in this contest.')
+    return history.History(db_path)
+
+
+def problems_history(problems, _):
+    db = open_history()
+    for run_id, action, host, timestamp, count in db.runs():
+        indent(1, '%s  %-6s %s  %-20s %d results' %
+               (bold('%4d' % run_id), action,
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp)),
+                host, count))
+    db.close()
+
+
+def problems_compare(problems, args):
+    db = open_history()
+    runs = db.runs(limit=-1)
+    try:
+        ids = [int(arg) for arg in args[:2]]
+    except ValueError:
+        error_message('Run ids must be integers.')
+    run_id = ids[1] if len(ids) > 1 else runs[0][0] if runs else None
+    baseline_id = ids[0] if ids else None
+    if baseline_id is None:
+        action = [r[1] for r in runs if r[0] == run_id]
+        older = [r[0] for r in runs if r[0] < run_id and r[1] in action]
+        baseline_id = older[0] if older else None
+    if baseline_id is None or run_id is None:
+        error_message('Not enough runs to compare.')
+
+    header('Comparing run %d against baseline %d' % (run_id, baseline_id))
+    slower = False
+    report = db.compare(baseline_id, run_id, [str(p) for p in problems])
+    db.close()
+    for problem, solution, tests, ratio, significant in report:
+        start_task('[%s] %s' % (problem, os.path.basename(solution)))
+        msg = 'x%.2f over %d tests' % (ratio, tests)
+        if significant:
+            slower = True
+            msg = 'Slower ' + msg
+        end_task(TaskResult(msg, not significant))
+    if slower:
+        sys.exit(1)
+
+
+def problems_dedupe(problems, _):
+    for problem in problems:
+        task_header(problem, "Looking for duplicated tests")
+        problem.dedupe(start_task, end_task, OPTS['drop'])
+
+
+def merge_results(file_paths):
+    if not file_paths:
+        error_message('You have to specify the results files to merge.')
+    entries, problems = results.merge(file_paths)
+    failed = False
+    groups = {}
+    for entry in entries:
+        groups.setdefault((entry['problem'], entry['solution']),
+                          []).append(entry)
+    for (problem, solution), group in sorted(groups.items()):
+        task_header(problem, solution)
+        for entry in group:
+            if not entry['status']:
+                start_task(entry['test'])
+                end_task(TaskResult(entry['verdict'],
+                                    not results.failed(entry)))
+        passed = len([entry for entry in group if entry['status']])
+        start_task('Passed')
+        ok = not any(results.failed(entry) for entry in group)
+        end_task(TaskResult('%d/%d' % (passed, len(group)), ok))
+        failed = failed or not ok
+    if problems:
+        writeln()
+        for msg in problems:
+            show_message('Error', msg, ERROR)
+    if OPTS['results']:
+        merged = results.Results(OPTS['results'], 'merge')
+        for entry in entries:
+            merged.record(**entry)
+        merged.save()
+    if failed or problems:
+        sys.exit(1)
+
 
 def problem_mode(args):
     if not args:
@@ -345,35 +945,81 @@ def problem_mode(args):
         'run': problems_run,
         'compress' : problems_compress,
         'normalize' : problems_normalize,
+        'stress' : problems_stress,
+        'complexity' : problems_complexity,
+        'stats' : problems_stats,
+        'history' : problems_history,
+        'compare' : problems_compare,
+        'dedupe' : problems_dedupe,
     }
 
+    if args[0] == 'merge':
+        # Paths are relative to the current directory, which doesn't need
+        # to be in a contest.
+        merge_results(args[1:])
+        return
+
     problem_call = change_directory()
-    contest = Contest(os.getcwd())
+    contest = load_model(Contest, os.getcwd())
 
     if args[0] == 'new':
         new_problem(args[1:])
     elif args[0] in actions:
         if OPTS['problem']:
-            problems = [Problem(os.path.join(os.getcwd(), OPTS['problem']))]
+            problems = [load_model(Problem, os.path.join(os.getcwd(),
+                                                         OPTS['problem']))]
         elif problem_call:
-            problems = [Problem(problem_call)]
+            problems = [load_model(Problem, problem_call)]
         else:
             problems = contest.get_problems()
 
         if not problems:
             show_message("Warning", "no problems", WARNING)
 
-        actions[args[0]](problems, args[1:])
+        if args[0] in ('run', 'check'):
+            apply_shard(problems, args[0])
+            if not OPTS['plan']:
+                history.start(os.path.join(os.getcwd(), history.DB_NAME),
+                              args[0], lambda msg: show_message('Warning', msg,
+                                                                WARNING))
+                if OPTS['results']:
+                    results.start(OPTS['results'], args[0], OPTS['shard'])
+        try:
+            actions[args[0]](problems, args[1:])
+        finally:
+            history.stop()
+            results.stop()
 
     else:
         error_message('Unknown action for problem.')
 
 
 def main():
+    argv = sys.argv[1:]
+    if use_server(argv):
+        status = server.forward(argv)
+        if status is not None:
+            sys.exit(status)
+    run(argv)
+
+
+def use_server(argv):
+    """Whether the command may be forwarded to a running server. Commands
+    managing the server itself, or creating contests, always run locally."""
     try:
-        optlist, args = getopt.gnu_getopt(sys.argv[1:], 'hp:',
-                                          ['help', 'partial', 'problem=',
-                                           'phase=', 'sample'])
+        optlist, args = getopt.gnu_getopt(argv, SHORT_OPTS, LONG_OPTS)
+    except getopt.GetoptError:
+        return False
+    if ('--no-server', '') in optlist:
+        return False
+    return not (args[:2] == ['contest', 'server'] or
+                args[:2] == ['contest', 'new'] or
+                args[:2] == ['contest', 'worker'])
+
+
+def run(argv):
+    try:
+        optlist, args = getopt.gnu_getopt(argv, SHORT_OPTS, LONG_OPTS)
     except getopt.GetoptError as err:
         error_message(str(err))
 
@@ -403,6 +1049,33 @@ def main():
             OPTS['sample'] = True
         elif key == '--phase':
             os.environ["OCIMATIC_PHASE"] = val
+        elif key == '--jobs' or key == '-j':
+            OPTS['jobs'] = positive_int(key, val)
+        elif key == '--cases':
+            OPTS['cases'] = positive_int(key, val)
+        elif key == '--max-size':
+            OPTS['max_size'] = positive_int(key, val)
+        elif key == '--coordinator':
+            OPTS['coordinator'] = val
+        elif key == '--local-workers':
+            OPTS['local_workers'] = positive_int(key, val)
+        elif key == '--drop':
+            OPTS['drop'] = True
+        elif key == '--force':
+            OPTS['force'] = True
+        elif key == '--test-major':
+            OPTS['test_major'] = True
+        elif key == '--plan':
+            OPTS['plan'] = True
+        elif key == '--shard':
+            OPTS['shard'] = parse_shard(val)
+        elif key == '--results':
+            OPTS['results'] = os.path.abspath(val)
+        elif key == '--trace':
+            OPTS['trace'] = os.path.abspath(val)
+
+    if OPTS['trace']:
+        trace.enable()
 
     # Select mode
     try:
@@ -412,3 +1085,36 @@ def main():
             error_message('Unknown mode.')
     except OcimaticException as exc:
         error_message(str(exc))
+    finally:
+        if OPTS['trace']:
+            write_trace(OPTS['trace'])
+
+
+def parse_shard(val):
+    try:
+        index, count = [int(part) for part in val.split('/')]
+    except ValueError:
+        index, count = 0, 0
+    if not 1 <= index <= count:
+        error_message('Option --shard expects I/N with 1 <= I <= N.')
+    return index, count
+
+
+def positive_int(key, val):
+    try:
+        num = int(val)
+    except ValueError:
+        num = 0
+    if num <= 0:
+        error_message('Option %s expects a positive integer.' % key)
+    return num
+
+
+def write_trace(file_path):
+    trace.dump(file_path)
+    writeln()
+    header('Time summary')
+    for name, count, total in trace.summary():
+        indent(1, '%-12s %8.3fs  (%d calls)' % (name, total, count))
+    show_message('Info', 'Trace written to %s' % file_path)
+    trace.disable()
@@ -0,0 +1,117 @@
+"""Empirical complexity of solutions.
+
+A solution is timed on inputs of increasing size n, and the times are fit by
+least squares to t = a + b f(n) for every growth curve f in `CURVES`. The
+fit has a closed form, so no numerical library is needed. The constant a
+absorbs the cost of starting the process. Curves whose slope comes out
+negative are fit with a constant instead. Curves are tried from the
+slowest-growing one, and a faster-growing curve only wins if it leaves at
+most `SIGNIFICANCE` times the sum of squared residuals of the curve chosen
+so far, so noise isn't mistaken for growth. The winning fit extrapolates the
+time at the largest size the problem allows.
+
+Times spread over many orders of magnitude, so the largest inputs dominate
+the fit. That's what extrapolation needs, but at least a few inputs must
+take well over a millisecond for the growth to be told apart from noise:
+when all times are within `RESOLUTION` of each other there's nothing to fit
+(see `too_fast`).
+"""
+import math
+
+SIGNIFICANCE = 0.5
+
+# Seconds
+RESOLUTION = 0.002
+
+CURVES = [
+    ('1', lambda n: 1.0),
+    ('log n', lambda n: math.log(n)),
+    ('n', lambda n: float(n)),
+    ('n log n', lambda n: n * math.log(n)),
+    ('n^2', lambda n: float(n) ** 2),
+    ('n^2 log n', lambda n: float(n) ** 2 * math.log(n)),
+    ('n^3', lambda n: float(n) ** 3),
+    ('2^n', lambda n: 2.0 ** n),
+]
+
+
+class Fit:
+    def __init__(self, curve, fun, a, b, residual, r2):
+        self.curve = curve
+        self._fun = fun
+        self.a = a
+        self.b = b
+        self.residual = residual
+        self.r2 = r2
+
+    def __str__(self):
+        return 'O(%s)' % self.curve
+
+    def predict(self, n):
+        """Predicted time for size `n`, or None if it overflows."""
+        try:
+            return self.a + self.b * self._fun(n)
+        except (OverflowError, ValueError):
+            return None
+
+
+def fit_curve(curve, fun, points):
+    """Least squares fit of t = a + b fun(n) with b >= 0 to `points`, a list
+    of (n, t).
+    Returns:
+      (Fit) or None if `fun` can't be evaluated at some n.
+    """
+    try:
+        xs = [fun(n) for n, _ in points]
+    except (OverflowError, ValueError):
+        return None
+    if not all(math.isfinite(x) for x in xs):
+        return None
+    # Values of fast-growing curves are close to the largest float, so the
+    # fit is done on them scaled to [0, 1].
+    scale = max(abs(x) for x in xs) or 1.0
+    xs = [x / scale for x in xs]
+    ts = [t for _, t in points]
+    mean_x = sum(xs) / len(xs)
+    mean_t = sum(ts) / len(ts)
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxt = sum((x - mean_x) * (t - mean_t) for x, t in zip(xs, ts))
+    b = sxt / sxx if sxx > 0 and sxt > 0 else 0.0
+    a = mean_t - b * mean_x
+    residual = sum((t - a - b * x) ** 2 for x, t in zip(xs, ts))
+    total = sum((t - mean_t) ** 2 for t in ts)
+    r2 = 1.0 - residual / total if total > 0 else 1.0
+    return Fit(curve, fun, a, b / scale, residual, r2)
+
+
+def too_fast(points):
+    """Whether the times of `points`, a list of (n, t), are too close to each
+    other to tell any growth."""
+    times = [t for _, t in points]
+    return max(times) - min(times) < RESOLUTION
+
+
+def best_fit(points):
+    """Fit every curve in `CURVES` to `points`, a list of (n, t), with at
+    least three distinct sizes, and choose the slowest-growing curve that
+    fits significantly better than slower ones.
+    Returns:
+      (Fit) or None if there aren't enough points.
+    """
+    if len(set(n for n, _ in points)) < 3:
+        return None
+    best = None
+    for curve, fun in CURVES:
+        fit = fit_curve(curve, fun, points)
+        if fit and (best is None or
+                    fit.residual < best.residual * SIGNIFICANCE):
+            best = fit
+    return best
+
+
+def sizes(max_size, count=8):
+    """About `count` sizes growing geometrically from 1 to `max_size`."""
+    if max_size <= 1:
+        return [1]
+    return sorted(set(max(1, int(round(max_size ** (i / (count - 1.0)))))
+                      for i in range(count)))
@@ -0,0 +1,121 @@
+"""Compressed test data.
+
+Inputs and expected outputs may be stored compressed with gzip, xz or zstd
+(`test.in.gz`, `test.sol.xz`, `test.in.zst`, ...). They are never expanded
+on disk: every reader gets the output of a decompressor through a pipe.
+Programs that receive file paths (checkers, interactors) get a /proc path to
+the pipe, so they must read those files sequentially and only once. This
+needs Linux and the `gzip`, `xz` or `zstd` command.
+"""
+import os
+import signal
+import subprocess
+from contextlib import contextmanager
+from tempfile import TemporaryFile
+
+DECOMPRESSORS = {
+    '.gz': ['gzip', '-dc'],
+    '.xz': ['xz', '-dc'],
+    '.zst': ['zstd', '-dcq'],
+}
+
+COMPRESSORS = {
+    '.gz': ['gzip', '-c'],
+    '.xz': ['xz', '-c'],
+    '.zst': ['zstd', '-cq'],
+}
+
+
+def suffix(file_path):
+    """Return the compression suffix of `file_path`, or '' if it isn't
+    compressed."""
+    ext = os.path.splitext(file_path)[1]
+    return ext if ext in DECOMPRESSORS else ''
+
+
+def strip(file_path):
+    """Return `file_path` without its compression suffix."""
+    return file_path[:len(file_path) - len(suffix(file_path))]
+
+
+def find(plain_path):
+    """Return the path of the file `plain_path`, or of a compressed version
+    of it, that exists, or None."""
+    for ext in [''] + sorted(DECOMPRESSORS):
+        if os.path.isfile(plain_path + ext):
+            return plain_path + ext
+    return None
+
+
+@contextmanager
+def _decompressor(file_path, compression):
+    with TemporaryFile() as err_file:
+        process = subprocess.Popen(DECOMPRESSORS[compression] + [file_path],
+                                   stdout=subprocess.PIPE, stderr=err_file)
+        try:
+            yield process.stdout
+        finally:
+            # A reader may stop before the end, in which case the
+            # decompressor gets a broken pipe.
+            process.stdout.close()
+            process.wait()
+        if process.returncode not in (0, -signal.SIGPIPE):
+            err_file.seek(0)
+            if b'Broken pipe' not in err_file.read():
+                raise Exception('Failed to decompress %s' % file_path)
+
+
+@contextmanager
+def stream(file_path, as_path=False, compression=None):
+    """Yield where to read the content of `file_path` from: the path itself
+    if it isn't compressed, otherwise the read end of a pipe fed by a
+    decompressor, as a file descriptor or, if `as_path` is true, as a path
+    other processes can open. `compression` overrides the suffix of the
+    file, for files named otherwise. Missing files are yielded as they are.
+    """
+    if compression is None:
+        compression = suffix(file_path)
+    if not compression or not os.path.isfile(file_path):
+        yield file_path
+        return
+    with _decompressor(file_path, compression) as pipe:
+        if as_path:
+            yield '/proc/%d/fd/%d' % (os.getpid(), pipe.fileno())
+        else:
+            yield pipe.fileno()
+
+
+@contextmanager
+def open_file(file_path, compression=None):
+    """Open `file_path` for reading its decompressed content in binary
+    mode. `compression` is as in `stream`."""
+    if compression is None:
+        compression = suffix(file_path)
+    if not compression:
+        with open(file_path, 'rb') as plain_file:
+            yield plain_file
+        return
+    with _decompressor(file_path, compression) as pipe:
+        yield pipe
+
+
+@contextmanager
+def sink(file_path):
+    """Yield where to write the content of `file_path` to: the path itself if
+    it isn't compressed, otherwise the file descriptor of a pipe to a
+    compressor writing to it."""
+    compression = suffix(file_path)
+    if not compression:
+        yield file_path
+        return
+    with open(file_path, 'wb') as dst_file:
+        process = subprocess.Popen(COMPRESSORS[compression],
+                                   stdin=subprocess.PIPE, stdout=dst_file,
+                                   stderr=subprocess.DEVNULL)
+        try:
+            yield process.stdin.fileno()
+        finally:
+            process.stdin.close()
+            process.wait()
+    if process.returncode != 0:
+        raise Exception('Failed to compress %s' % file_path)
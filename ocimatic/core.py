@@ -1,12 +1,28 @@
 import os
+import time
+import random
 import shutil
+import hashlib
+import zipfile
 import subprocess
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from math import floor, log
 from glob import glob
 from tempfile import mkdtemp, NamedTemporaryFile
 
 from .latex import Latex, Statement, merge_files
 from .source import make_solution_from_file_path, DiffChecker, CustomChecker
+from .source import PersistentChecker, Interactor, preload
+from .manifest import Manifest, file_hash
+from .figures import FigureCache, CACHE_DIR
+from . import trace
+from . import history
+from . import dedupe
+from . import compression
+from . import complexity
+from . import stats
+from .results import record as save_result
 
 
 class TaskResult:
@@ -26,6 +42,47 @@ class OcimaticException(Exception):
         return self._msg
 
 
+def format_memory(memory):
+    return '%.1fMB' % (memory / float(1 << 20))
+
+
+def run_formatter(outcome, time, memory=None):
+    if memory is None:
+        return '%.3f [%.3f]' % (outcome, time)
+    return '%.3f [%.3f %s]' % (outcome, time, format_memory(memory))
+
+
+def run_status(outcome, time):
+    return True
+
+
+def check_formatter(outcome, time, memory=None):
+    return 'OK' if outcome >= 1.0 else 'Failed'
+
+
+def check_status(outcome, time):
+    return outcome >= 1.0
+
+
+def grade(status, time, outcome, formatter, status_fun, memory=None,
+          memory_exceeded=False, output_exceeded=False):
+    """Turn the result of running a solution into a `TaskResult`. `outcome`
+    is the score given by the checker, which is ignored if the solution
+    failed."""
+    if memory_exceeded:
+        return TaskResult('Memory Limit Exceeded', False)
+    if output_exceeded:
+        return TaskResult('Output Limit Exceeded', False)
+    if not status:
+        return TaskResult('Runtime Error', False)
+    return TaskResult(formatter(outcome, time, memory),
+                      status_fun(outcome, time))
+
+
+# Output limit of solutions when the problem doesn't set one.
+DEFAULT_OUTPUT_LIMIT = 64 << 20
+
+
 def create_layout_for_contest(contest_path):
     ocimatic_dir = os.path.dirname(__file__)
     shutil.copytree(os.path.join(ocimatic_dir, "resources/contest-skel"),
@@ -45,8 +102,25 @@ class Contest:
     def get_problems(self):
         return self._problems
 
-    def gen_problemset_pdf(self):
+    def path(self):
+        return self._dir_path
+
+    def figure_cache(self):
+        return FigureCache(os.path.join(self._dir_path, CACHE_DIR))
+
+    def convert_figures(self, latex_files, jobs=None):
+        """Convert the figures of `latex_files` to PDF before compiling them.
+        Returns:
+          (list of string) figures that couldn't be converted.
+        """
+        return self.figure_cache().convert_all(
+            [figure for latex in latex_files for figure in latex.figures()],
+            jobs)
+
+    def gen_problemset_pdf(self, jobs=None):
         st = True
+        self.convert_figures([self._titlepage] +
+                             [p.statement() for p in self._problems], jobs)
         for problem in self._problems:
             st = problem.gen_pdf()
         st = self._titlepage.compile()
@@ -60,7 +134,9 @@ class Contest:
             cmd_line += " "+pdf
 
         f = open('/dev/null', 'a')
-        st = subprocess.call(cmd_line, stdout=f, shell=True) == 0
+        with trace.span('ghostscript', 'latex', pdfs=len(pdfs)) as span:
+            st = subprocess.call(cmd_line, stdout=f, shell=True) == 0
+            span.set(status=st)
 
         if st:
             msg = 'OK'
@@ -97,6 +173,28 @@ class Contest:
         # return TaskResult(msg, status)
 
 
+def read_config(file_path):
+    """Read a configuration file made of `key = value` lines. Empty lines and
+    lines starting with `#` are ignored.
+    Returns:
+      (dict of string to string)
+    """
+    config = {}
+    if not os.path.isfile(file_path):
+        return config
+    with open(file_path, 'r') as config_file:
+        for lineno, line in enumerate(config_file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            key, sep, value = line.partition('=')
+            if not sep:
+                raise OcimaticException('Invalid line %d in `%s`.' %
+                                        (lineno, file_path))
+            config[key.strip()] = value.strip()
+    return config
+
+
 def create_layout_for_problem(problem_path):
     ocimatic_dir = os.path.dirname(__file__)
     shutil.copytree(os.path.join(ocimatic_dir, "resources/problem-skel"),
@@ -117,10 +215,10 @@ def get_problems_from_dir(dir_path):
     return problems
 
 
-def get_solutions_from_dir(dir_path, managers_path):
+def get_solutions_from_dir(dir_path, managers_path, python='python3'):
     solutions = []
     for file_path in sorted(glob(os.path.join(dir_path, '*'))):
-        sol = make_solution_from_file_path(file_path, managers_path)
+        sol = make_solution_from_file_path(file_path, managers_path, python)
         if sol:
             solutions.append(sol)
     return solutions
@@ -133,16 +231,19 @@ class Problem:
         dir_path, name = os.path.split(os.path.normpath(path))
         self._path = path
         self._name = name
+        self._contest_path = os.path.dirname(os.path.abspath(path))
+        self._config = read_config(os.path.join(self._path, '.problem'))
 
         self._dataset = Dataset(os.path.join(self._path, 'testdata'))
 
+        python = self._config.get('python', 'python3')
         self._correct_solutions = get_solutions_from_dir(
             os.path.join(self._path, 'solutions/correct'),
-            os.path.join(self._path, 'managers'))
+            os.path.join(self._path, 'managers'), python)
 
         self._partial_solutions = get_solutions_from_dir(
             os.path.join(self._path, 'solutions/partial'),
-            os.path.join(self._path, 'managers'))
+            os.path.join(self._path, 'managers'), python)
 
         self._statement = Statement(os.path.join(self._path,
                                                  'documents/statement.tex',),
@@ -152,12 +253,24 @@ class Problem:
                          for s in self._statement.io_samples()]
 
         self._checker = DiffChecker()
-        if os.path.isfile(os.path.join(self._path, 'managers/checker')):
-            self._checker = CustomChecker(os.path.join(self._path,
-                                                       'managers/checker'))
+        checker_path = os.path.join(self._path, 'managers/checker')
+        if os.path.isfile(checker_path):
+            if self._config.get('checker') == 'persistent':
+                self._checker = PersistentChecker(checker_path)
+            else:
+                self._checker = CustomChecker(checker_path)
 
-    def compress(self):
-        return self._dataset.compress()
+        self._selection = None
+        # Solution -> (modification time, hash) of its built program.
+        self._binary_hashes = {}
+
+        self._interactor = None
+        interactor_path = os.path.join(self._path, 'managers/interactor')
+        if os.path.isfile(interactor_path):
+            self._interactor = Interactor(interactor_path)
+
+    def compress(self, force=False):
+        return self._dataset.compress(force=force)
 
     def statement(self):
         return self._statement
@@ -168,6 +281,41 @@ class Problem:
     def __str__(self):
         return self.name()
 
+    def memory_limit(self):
+        """Memory limit in bytes from the `memory` option (MB) of the problem
+        configuration, or None."""
+        if 'memory' not in self._config:
+            return None
+        try:
+            return int(float(self._config['memory']) * (1 << 20))
+        except ValueError:
+            raise OcimaticException('Invalid memory limit `%s` in problem %s.'
+                                    % (self._config['memory'], self._name))
+
+    def output_limit(self, test=None):
+        """Output limit in bytes from the `output` option (MB) of the problem
+        configuration. By default it's `DEFAULT_OUTPUT_LIMIT`, or twice the
+        size of the expected output of `test` if that's larger. The size of
+        compressed expected outputs isn't known, so they get the default.
+        Returns:
+          (int)
+        """
+        if 'output' in self._config:
+            try:
+                return int(float(self._config['output']) * (1 << 20))
+            except ValueError:
+                raise OcimaticException('Invalid output limit `%s` in problem'
+                                        ' %s.' % (self._config['output'],
+                                                  self._name))
+        if test is None or not test.has_expected() or \
+           compression.suffix(test.expected_path()):
+            return DEFAULT_OUTPUT_LIMIT
+        return max(DEFAULT_OUTPUT_LIMIT,
+                   2 * os.path.getsize(test.expected_path()))
+
+    def is_interactive(self):
+        return self._interactor is not None
+
     def gen_pdf(self, start_callback=lambda x: x, end_callback=lambda x : x):
         start_callback(str(self._statement))
         if self._statement.gen_pdf():
@@ -182,71 +330,655 @@ class Problem:
             for test in self._samples:
                 yield test
 
-    def normalize(self):
-        self._dataset.normalize()
+    def normalize(self, force=False):
+        self._dataset.normalize(force)
         for sample in self._samples:
             sample.normalize()
 
-    def run(self, solution_callback, start_callback, end_callback,
-            partial, sample=False,
-            formatter=lambda outcome, time: '%.3f [%.3f]' % (outcome, time),
-            status_fun=lambda outcome, time: True):
+    def solutions(self, partial=False):
         solutions = self._correct_solutions
         if partial:
-            solutions += self._partial_solutions
-        for solution in self._correct_solutions:
-            solution_callback(str(solution))
-            for test in self.__testdata_iter(sample):
+            solutions = solutions + self._partial_solutions
+        return solutions
+
+    def tests(self, sample=False):
+        return list(self.__testdata_iter(sample))
+
+    def checker(self):
+        return self._checker
+
+    def restrict(self, jobs=None):
+        """Make `run` and `check` only run the (solution, test) pairs in
+        `jobs`, e.g. the ones of a shard, or everything if `jobs` is None."""
+        self._selection = None if jobs is None else set(jobs)
+
+    def selected(self, solution, test):
+        """Whether `solution` must be run on `test` (see `restrict`)."""
+        return self._selection is None or (solution, test) in self._selection
+
+    def report(self, solution, test, result, time=None, memory=None):
+        """Save the result of `solution` on `test` in the results file (see
+        results.py)."""
+        save_result(self.name(), self.solution_key(solution),
+                    os.path.relpath(str(test)), result.msg,
+                    bool(result.status), solution in self._correct_solutions,
+                    time, memory)
+
+    def run(self, solution_callback, start_callback, end_callback,
+            partial, sample=False,
+            formatter=run_formatter, status_fun=run_status,
+            test_major=False, skip=()):
+        """Run solutions on all tests except those in `skip`.
+        Returns:
+          (dict of TestData to bool) whether all solutions succeeded on each
+        test that was run.
+        """
+        solutions = self.solutions(partial)
+        tests = [test for test in self.__testdata_iter(sample)
+                 if test not in skip]
+        try:
+            if test_major:
+                results = self._run_test_major(solutions, tests,
+                                               solution_callback,
+                                               start_callback, end_callback,
+                                               formatter, status_fun)
+            else:
+                results = self._run(solutions, tests, solution_callback,
+                                    start_callback, end_callback, formatter,
+                                    status_fun)
+        finally:
+            self._checker.close()
+        if skip:
+            start_callback('Unchanged tests')
+            end_callback(TaskResult('%d skipped' % len(skip)))
+        passed = dict((test, True) for test in tests)
+        for test, result in results:
+            passed[test] = passed[test] and result.status
+        return passed
+
+    def _run_test_major(self, solutions, tests, solution_callback,
+                        start_callback, end_callback, formatter, status_fun,
+                        buffer_size=256 << 20):
+        """Run every solution on a test before moving to the next one. Each
+        input is read once and fed to all solutions through a pipe, unless it
+        is larger than `buffer_size` or compressed, in which case it's read
+        from disk.
+        Results are reported afterwards grouped by solution as usual."""
+        results = dict((solution, []) for solution in solutions)
+        for test in tests:
+            in_data = None
+            if not self._interactor and not test.is_compressed() and \
+               os.path.getsize(test.input_path()) <= buffer_size:
+                in_data = preload(test.input_path())
+            try:
+                for solution in solutions:
+                    if self.selected(solution, test):
+                        results[solution].append(
+                            (test, self.judge(solution, test, formatter,
+                                              status_fun, in_data)))
+            finally:
+                if in_data is not None:
+                    in_data.close()
+
+        for solution in solutions:
+            if not results[solution]:
+                continue
+            solution_callback(self.solution_label(solution))
+            for test, result in results[solution]:
+                start_callback(str(test))
+                end_callback(result)
+        return [r for solution in solutions for r in results[solution]]
+
+    def _run(self, solutions, tests, solution_callback, start_callback,
+             end_callback, formatter, status_fun):
+        results = []
+        for solution in solutions:
+            selected = [test for test in tests
+                        if self.selected(solution, test)]
+            if not selected:
+                continue
+            solution_callback(self.solution_label(solution))
+            for test in selected:
                 start_callback(str(test))
-                try:
-                    with NamedTemporaryFile() as tmp_file:
-                        out_path = tmp_file.name
-                        if not test.has_expected():
-                            status = False
-                            msg = 'No expected file'
-                        else:
-                            status, time = solution.run(test.input_path(),
-                                                        out_path)
-
-                            if not status:
-                                status = False
-                                msg = 'Runtime Error'
-                            else:
-                                outcome = self._checker(test.input_path(),
-                                                        test.expected_path(),
-                                                        out_path)
-                                msg = formatter(outcome, time)
-                                status = status_fun(outcome, time)
-                except Exception as e:
-                    # raise e
-                    status = False
-                    msg = str(e)
-
-                end_callback(TaskResult(msg, status))
-
-    def check(self, solution_callback, start_callback, end_callback, sample=True):
-        self.run(solution_callback, start_callback, end_callback,
-                 False, sample,
-                 lambda outcome, _: ('OK' if outcome >= 1.0 else 'Failed'),
-                 lambda outcome, _: outcome >= 1.0)
+                result = self.judge(solution, test, formatter, status_fun)
+                results.append((test, result))
+                end_callback(result)
+        return results
+
+    def solution_key(self, solution):
+        """Path of the source of `solution` relative to the contest root. It
+        identifies the solution in the history, so records made from other
+        checkouts of the contest are comparable."""
+        return os.path.relpath(solution.source_path(), self._contest_path)
+
+    def _binary_hash(self, solution):
+        """Hash of the built program of `solution`, or None if it isn't
+        built. It's only computed again when the program is rebuilt."""
+        if solution.need_rebuilt():
+            return None
+        artifact = solution.artifact()
+        if not artifact:
+            return None
+        mtime = os.path.getmtime(artifact[0])
+        cached = self._binary_hashes.get(solution)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, file_hash(artifact[0]))
+            self._binary_hashes[solution] = cached
+        return cached[1]
+
+    def record(self, solution, test, result, cpu_time, wall_time,
+               memory=None):
+        """Save the result of running `solution` on `test` in the history."""
+        history.record(self.name(), self.solution_key(solution),
+                       self._binary_hash(solution), str(test),
+                       self.input_hash(test), result.msg, result.status,
+                       cpu_time, wall_time, memory)
+
+    def solution_label(self, solution):
+        startup = solution.startup_time()
+        if startup:
+            return '%s (startup %.3f not counted)' % (solution, startup)
+        return str(solution)
+
+    def judge(self, solution, test, formatter=run_formatter,
+              status_fun=run_status, in_data=None):
+        """Run `solution` on `test` and grade it. If `in_data` is given it's
+        used as the content of the input instead of reading it from disk.
+        Returns:
+          (TaskResult)
+        """
+        span = trace.span('test', 'run', problem=self, solution=solution,
+                          test=test)
+        usage = None
+        try:
+            with span, NamedTemporaryFile() as tmp_file:
+                out_path = tmp_file.name
+                if self._interactor:
+                    wall_start = time.perf_counter()
+                    with test.input_stream(True) as in_path, \
+                            test.expected_stream(True) as expected_path:
+                        usage, outcome = self._interactor(
+                            solution, in_path, expected_path,
+                            self.memory_limit())
+                    wall_time = time.perf_counter() - wall_start
+                    result = grade(usage.status, usage.time, outcome,
+                                   formatter, status_fun, usage.memory,
+                                   usage.memory_exceeded)
+                    self.record(solution, test, result, usage.time, wall_time,
+                                usage.memory)
+                elif not test.has_expected():
+                    result = TaskResult('No expected file', False)
+                else:
+                    # With the default checker the output is compared while
+                    # the solution runs.
+                    expected_file = nullcontext()
+                    if isinstance(self._checker, DiffChecker):
+                        expected_file = compression.open_file(
+                            test.expected_path())
+                    wall_start = time.perf_counter()
+                    with test.input_stream() as in_source, \
+                            expected_file as expected:
+                        usage = solution.run(
+                            in_source if in_data is None else in_data,
+                            out_path, memory_limit=self.memory_limit(),
+                            output_limit=self.output_limit(test),
+                            expected=expected)
+                    wall_time = time.perf_counter() - wall_start
+                    outcome = None
+                    if usage.matches is not None:
+                        outcome = 1.0 if usage.matches else 0.0
+                    elif usage.status:
+                        with test.input_stream(True) as in_path, \
+                                test.expected_stream(True) as expected_path:
+                            outcome = self._checker(in_path, expected_path,
+                                                    out_path)
+                    result = grade(usage.status, usage.time, outcome,
+                                   formatter, status_fun, usage.memory,
+                                   usage.memory_exceeded,
+                                   usage.output_exceeded)
+                    self.record(solution, test, result, usage.time, wall_time,
+                                usage.memory)
+                span.set(status=result.status, verdict=result.msg)
+        except Exception as e:
+            # raise e
+            result = TaskResult(str(e), False)
+
+        if usage is None:
+            self.report(solution, test, result)
+        else:
+            self.report(solution, test, result, usage.time, usage.memory)
+        return result
+
+    def _programs_key(self, solutions):
+        """Hash identifying the sources of the solutions and every file in
+        the managers directory (grader, checker, interactor), plus the
+        problem configuration."""
+        hashes = [file_hash(solution.source_path()) for solution in solutions]
+        for manager_path in sorted(glob(os.path.join(self._path, 'managers',
+                                                     '*'))):
+            if os.path.isfile(manager_path):
+                hashes.append(file_hash(manager_path))
+        hashes.append(repr(sorted(self._config.items())))
+        return hashlib.sha256(' '.join(hashes).encode()).hexdigest()
+
+    def unchanged_tests(self, force=False):
+        """Tests of the dataset that passed the last check and haven't changed
+        since, with the same solutions and checker.
+        Returns:
+          (set of TestData)
+        """
+        if force:
+            return set()
+        changed = self._dataset.changed_tests(
+            'check', self._programs_key(self._correct_solutions))
+        return set(self._dataset) - set(changed)
+
+    def mark_checked(self, passed, skip):
+        """Record the tests that passed a check. `passed` is the result of
+        `run` and `skip` the tests that weren't run. Nothing is recorded when
+        only part of the solutions and tests were run (see `restrict`)."""
+        if self._selection is not None:
+            return
+        self._dataset.mark('check', [test for test in self._dataset
+                                     if passed.get(test, test in skip)],
+                           self._programs_key(self._correct_solutions))
+
+    def check(self, solution_callback, start_callback, end_callback, sample=True,
+              test_major=False, force=False):
+        """Check correct solutions. Tests that passed the last check and
+        haven't changed since, with the same solutions and checker, are
+        skipped unless `force` is true."""
+        skip = self.unchanged_tests(force)
+        passed = self.run(solution_callback, start_callback, end_callback,
+                          False, sample, check_formatter, check_status,
+                          test_major, skip)
+        self.mark_checked(passed, skip)
 
     def gen_solutions_for_dataset(self, start_callback, end_callback,
-                                  sample=False):
+                                  sample=False, force=False):
+        """Generate expected outputs. Only inputs that changed since the last
+        time, or that don't have an expected output, are processed unless
+        `force` is true or the solution changed."""
         if len(self._correct_solutions) == 0:
             return
         # We use any correct solution
         solution = self._correct_solutions[0]
-        for test in self.__testdata_iter(sample):
+        key = self._programs_key([solution])
+        tests = list(self._dataset)
+        if not force:
+            changed = set(self._dataset.changed_tests('expected', key,
+                                                      expected=False))
+            tests = [test for test in tests
+                     if test in changed or not test.has_expected()]
+        if sample:
+            tests += self._samples
+        done = []
+        for test in tests:
             start_callback(str(test))
-            if solution.run(test.input_path(), test.expected_path()):
+            try:
+                with test.input_stream() as in_source, \
+                        compression.sink(test.expected_path()) as out:
+                    status = solution.run(in_source, out).status
+            except Exception:
+                status = False
+            if status:
+                done.append(test)
                 end_callback(TaskResult('OK'))
             else:
                 end_callback(TaskResult('Failed', False))
+        skipped = len(self._dataset) + len(self._samples) * sample - len(tests)
+        if skipped:
+            start_callback('Unchanged tests')
+            end_callback(TaskResult('%d skipped' % skipped))
+        self._dataset.mark('expected', [test for test in done
+                                        if test in self._dataset],
+                           key, expected=False)
+
+    def _generator(self):
+        """Returns the test generator in `managers/generator.*` or None. The
+        generator is called with a seed and a size as arguments and must
+        print a test input to its standard output."""
+        for file_path in sorted(glob(os.path.join(self._path, 'managers',
+                                                  'generator.*'))):
+            generator = make_solution_from_file_path(
+                file_path, '', self._config.get('python', 'python3'))
+            if generator:
+                return generator
+        return None
 
-    def build_all(self, start_callback, end_callback):
-        for solution in self._correct_solutions + self._partial_solutions:
+    def _stress_case(self, generator, reference, solutions, seed, size):
+        """Run a single random case. Returns None if all solutions agree with
+        the reference, otherwise a tuple (solution, message, input, expected)
+        where input and expected are the contents of the failing test."""
+        tmpdir = mkdtemp()
+        try:
+            in_path = os.path.join(tmpdir, 'test.in')
+            expected_path = os.path.join(tmpdir, 'test.sol')
+            out_path = os.path.join(tmpdir, 'test.out')
+            if not generator.run(None, in_path, str(seed), str(size)).status:
+                raise OcimaticException('Generator failed with seed %d' % seed)
+            if not reference.run(in_path, expected_path).status:
+                raise OcimaticException('Reference solution failed with'
+                                        ' seed %d' % seed)
+            output_limit = self.output_limit(
+                TestData(os.path.join(tmpdir, 'test')))
+            for solution in solutions:
+                usage = solution.run(in_path, out_path,
+                                     memory_limit=self.memory_limit(),
+                                     output_limit=output_limit)
+                if usage.memory_exceeded:
+                    msg = 'Memory Limit Exceeded'
+                elif usage.output_exceeded:
+                    msg = 'Output Limit Exceeded'
+                elif not usage.status:
+                    msg = 'Runtime Error'
+                elif self._checker(in_path, expected_path, out_path) < 1.0:
+                    msg = 'Wrong Answer'
+                else:
+                    continue
+                with open(in_path, 'rb') as in_file, \
+                     open(expected_path, 'rb') as expected_file:
+                    return solution, msg, in_file.read(), expected_file.read()
+            return None
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def _stress_batch(self, executor, window, generator, reference, solutions,
+                      cases):
+        """Run (seed, size) cases in parallel stopping at the first failure.
+        Returns (seed, size, failure) or None."""
+        futures = {}
+        pending = iter(cases)
+        try:
+            # Keep a bounded number of cases in flight so we can stop early.
+            for case in pending:
+                futures[executor.submit(self._stress_case, generator,
+                                        reference, solutions, *case)] = case
+                if len(futures) >= window:
+                    break
+            while futures:
+                future = next(iter(futures))
+                case = futures.pop(future)
+                failure = future.result()
+                if failure:
+                    return case + (failure,)
+                for case in pending:
+                    futures[executor.submit(self._stress_case, generator,
+                                            reference, solutions, *case)] = case
+                    break
+            return None
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def stress(self, start_callback, end_callback, cases=1000, max_size=100,
+               jobs=None, tries=20):
+        """Compare all solutions against the first correct solution on random
+        tests produced by the generator. On the first disagreement the input
+        is shrunk by looking for the smallest size that still fails and the
+        case is added to the testdata directory. Seeds start at a random
+        base, shown with the case, so each invocation tries new cases and a
+        failure can be reproduced by running the generator with the seed and
+        size reported."""
+        generator = self._generator()
+        if not generator:
+            raise OcimaticException('No generator found in `%s`.' %
+                                    os.path.join(self._path, 'managers'))
+        if not self._correct_solutions:
+            raise OcimaticException('No correct solution for `%s`.' % self)
+        reference = self._correct_solutions[0]
+        solutions = self._correct_solutions[1:] + self._partial_solutions
+        if not solutions:
+            raise OcimaticException('Nothing to compare against `%s`.' %
+                                    reference)
+
+        start_callback('Building')
+        try:
+            built = all([s.build()
+                         for s in [generator, reference] + solutions])
+        except OcimaticException as exc:
+            end_callback(TaskResult(str(exc), False))
+            return
+        end_callback(TaskResult('OK' if built else 'Failed', built))
+        if not built:
+            return
+
+        base = random.randrange(1 << 30)
+        rng = random.Random(base)
+        window = 4 * (jobs or os.cpu_count() or 1)
+        with ThreadPoolExecutor(jobs) as executor:
+            start_callback('Running %d random cases from seed %d' %
+                           (cases, base))
+            failure = self._stress_batch(
+                executor, window, generator, reference, solutions,
+                ((seed, rng.randint(1, max_size))
+                 for seed in range(base, base + cases)))
+            if not failure:
+                end_callback(TaskResult('OK'))
+                return
+            seed, size, (solution, msg, _, _) = failure
+            end_callback(TaskResult('%s: %s (seed %d, size %d)' %
+                                    (solution, msg, seed, size), False))
+
+            # Binary search the smallest size for which some seed fails.
+            start_callback('Shrinking counterexample')
+            lo, hi = 1, size
+            while lo < hi:
+                mid = (lo + hi) // 2
+                smaller = self._stress_batch(
+                    executor, window, generator, reference, [solution],
+                    ((seed, mid) for seed in range(base + cases,
+                                                   base + cases + tries)))
+                if smaller:
+                    failure = smaller
+                    hi = mid
+                else:
+                    lo = mid + 1
+            seed, size, (solution, msg, in_data, expected_data) = failure
+            end_callback(TaskResult('seed %d, size %d' % (seed, size), False))
+
+        start_callback('Saving counterexample')
+        i = 1
+        while os.path.exists(os.path.join(self._dataset.path(),
+                                          'stress%d.in' % i)):
+            i += 1
+        basename = os.path.join(self._dataset.path(), 'stress%d' % i)
+        with open(basename + TestData.input_ext, 'wb') as in_file:
+            in_file.write(in_data)
+        with open(basename + TestData.expected_ext, 'wb') as expected_file:
+            expected_file.write(expected_data)
+        end_callback(TaskResult('%s (seed %d, size %d)' %
+                                (basename + TestData.input_ext, seed, size)))
+
+    def input_stats(self, test):
+        """Statistics of `test` from the index of the dataset, or None if
+        they weren't computed (see `stats`)."""
+        return self._dataset.cached_stats(test)
+
+    def input_hash(self, test):
+        return self._dataset.input_hash(test)
+
+    def stats(self, start_callback, end_callback, query=None, arg=None):
+        """Report statistics of the inputs of the dataset (see stats.py),
+        reading only inputs that changed since the last time. `query` may be
+        'largest', for the `arg` (default 3) largest tests of each subtask,
+        or 'bounds', for the tests whose values are within `arg` percent
+        (default 5) of the minimum or maximum of each column in the
+        dataset."""
+        name = lambda test: os.path.relpath(test.input_path(),
+                                            self._dataset.path())
+        all_stats = self._dataset.stats()
+        describe = lambda s: '%d bytes, %d lines, %d tokens' % (
+            s.size, s.lines, s.tokens)
+        if query == 'largest':
+            for subtask, tests in stats.largest(
+                    [(self._dataset.subtask(test), test, test_stats)
+                     for test, test_stats in all_stats], arg or 3):
+                for test, test_stats in tests:
+                    start_callback('%s: %s' % (subtask or '.', name(test)))
+                    end_callback(TaskResult(describe(test_stats)))
+        elif query == 'bounds':
+            margin = (5 if arg is None else arg) / 100.0
+            for key, low, at_low, high, at_high in stats.near_bounds(
+                    all_stats, margin):
+                for bound, tests in [('min %s' % low, at_low),
+                                     ('max %s' % high, at_high)]:
+                    start_callback('%s, %s' % (stats.column_name(key), bound))
+                    end_callback(TaskResult(', '.join(name(test)
+                                                      for test in tests)))
+        elif query is None:
+            for test, test_stats in all_stats:
+                start_callback(name(test))
+                end_callback(TaskResult(describe(test_stats)))
+            start_callback('Total')
+            end_callback(TaskResult('%d tests, %d bytes' % (
+                len(all_stats), sum(s.size for _, s in all_stats))))
+        else:
+            raise OcimaticException('Unknown statistics query `%s`.' % query)
+
+    def _size_limit(self, key):
+        if key not in self._config:
+            return None
+        try:
+            return int(self._config[key])
+        except ValueError:
+            raise OcimaticException('Invalid %s `%s` in problem %s.' %
+                                    (key, self._config[key], self._name))
+
+    def _time(self, solution, in_path, repeats):
+        """Minimum CPU time of `repeats` runs of `solution` on `in_path`, or
+        None if a run fails."""
+        times = []
+        for _ in range(repeats):
+            with compression.stream(in_path) as in_source:
+                usage = solution.run(in_source, '/dev/null',
+                                     memory_limit=self.memory_limit())
+            if not usage.status:
+                return None
+            times.append(usage.time)
+        return min(times)
+
+    def complexity(self, solution_callback, start_callback, end_callback,
+                   partial=False, max_size=100, repeats=3):
+        """Time solutions on inputs of increasing size and report the growth
+        curve that fits best (see complexity.py). Inputs come from the
+        generator, with sizes growing up to `max_size`, and the fit is
+        extrapolated to the `max_n` option of the problem. Without a
+        generator the tests of the dataset are used, the size being the
+        number of bytes of the input, and the fit is extrapolated to the
+        `max_input` option."""
+        if self._interactor:
+            raise OcimaticException('Interactive problems are not supported.')
+        generator = self._generator()
+        tmpdir = mkdtemp()
+        try:
+            if generator:
+                limit = self._size_limit('max_n')
+                inputs = []
+                start_callback('Generating inputs')
+                for size in complexity.sizes(max_size):
+                    in_path = os.path.join(tmpdir, '%d.in' % size)
+                    if not generator.run(None, in_path, str(size),
+                                         str(size)).status:
+                        end_callback(TaskResult('Generator failed with size'
+                                                ' %d' % size, False))
+                        return
+                    inputs.append(('n = %d' % size, size, in_path))
+                end_callback(TaskResult('%d sizes' % len(inputs)))
+            else:
+                limit = self._size_limit('max_input')
+                inputs = sorted([(str(test), test_stats.size,
+                                  test.input_path())
+                                 for test, test_stats in self._dataset.stats()],
+                                key=lambda i: i[1])
+
+            for solution in self.solutions(partial):
+                solution_callback(self.solution_label(solution))
+                points = []
+                for label, size, in_path in inputs:
+                    start_callback(label)
+                    elapsed = self._time(solution, in_path, repeats)
+                    if elapsed is None:
+                        end_callback(TaskResult('Failed', False))
+                    else:
+                        points.append((size, elapsed))
+                        end_callback(TaskResult('%.3f' % elapsed))
+                start_callback('Growth')
+                fit = complexity.best_fit(points)
+                if not fit:
+                    end_callback(TaskResult('Not enough sizes', False))
+                    continue
+                if complexity.too_fast(points):
+                    end_callback(TaskResult('Too fast to measure'))
+                    continue
+                msg = '%s (r2 %.2f)' % (fit, fit.r2)
+                predicted = fit.predict(limit) if limit else None
+                if predicted is not None:
+                    msg += ', %.3f at %d' % (predicted, limit)
+                elif limit:
+                    msg += ', too slow to estimate at %d' % limit
+                end_callback(TaskResult(msg))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def schedule_build(self, executor):
+        """Submit the build of all solutions to `executor`.
+        Returns:
+          (list of (Solution, Future))
+        """
+        return [(solution, executor.submit(solution.build))
+                for solution in self._correct_solutions +
+                self._partial_solutions]
+
+    def dedupe(self, start_callback, end_callback, drop=False, threshold=0.9):
+        """Report tests with identical inputs and pairs of tests with similar
+        inputs. If `drop` is true exact duplicates within a subtask are
+        deleted keeping the first test of each group. The same input in
+        several subtasks is usually intended, so it's reported but kept."""
+        name = lambda test: os.path.relpath(test.input_path(),
+                                            self._dataset.path())
+        found = False
+        duplicated = set()
+        for group in self._dataset.exact_duplicates():
+            firsts = {}
+            for test in group:
+                first = firsts.setdefault(self._dataset.subtask(test), test)
+                if test is group[0]:
+                    continue
+                found = True
+                duplicated.add(test)
+                start_callback(str(test))
+                if first is test:
+                    end_callback(TaskResult('Same as %s, in another subtask'
+                                            % name(group[0])))
+                    continue
+                msg = 'Same as %s' % name(first)
+                if drop:
+                    self._dataset.remove(test)
+                    msg = 'Removed, same as %s' % name(first)
+                end_callback(TaskResult(msg, False))
+
+        unique = [test for test in self._dataset if test not in duplicated]
+        for a, b, sim in self._dataset.near_duplicates(threshold, unique):
+            found = True
+            start_callback(str(b))
+            end_callback(TaskResult('%.1f%% similar to %s' % (sim * 100,
+                                                              name(a)),
+                                    False))
+        if not found:
+            start_callback('Duplicates')
+            end_callback(TaskResult('None'))
+
+    def build_all(self, start_callback, end_callback, builds=None):
+        """Build all solutions reporting them in order. `builds` are the
+        futures returned by `schedule_build`, if None solutions are built
+        sequentially."""
+        if builds is None:
+            builds = [(solution, None) for solution in
+                      self._correct_solutions + self._partial_solutions]
+        for solution, future in builds:
             start_callback(str(solution))
-            if solution.build():
+            if future.result() if future else solution.build():
                 end_callback(TaskResult('OK'))
             else:
                 end_callback(TaskResult('Failed', False))
@@ -258,40 +990,165 @@ class Dataset:
         self._dir_path = dir_path
 
         self._dataset = []
-        for file_path in sorted(glob(os.path.join(dir_path,
-                                                  '*' + TestData.input_ext)) +
-                                glob(os.path.join(dir_path, '*',
-                                                  '*' + TestData.input_ext))):
-            basename, _ = os.path.splitext(file_path)
+        patterns = ['*' + TestData.input_ext + ext
+                    for ext in [''] + sorted(compression.DECOMPRESSORS)]
+        basenames = set()
+        for pattern in patterns:
+            for file_path in glob(os.path.join(dir_path, pattern)) + \
+                    glob(os.path.join(dir_path, '*', pattern)):
+                basenames.add(os.path.splitext(
+                    compression.strip(file_path))[0])
+        for basename in sorted(basenames):
             self._dataset.append(TestData(basename))
+        self._manifest = None
+        self._stats_index = None
 
     def __iter__(self):
         for test in self._dataset:
             yield test
 
-    def normalize(self):
-        for test in self._dataset:
+    def __len__(self):
+        return len(self._dataset)
+
+    def __contains__(self, test):
+        return test in self._dataset
+
+    def path(self):
+        return self._dir_path
+
+    def _files(self, tests=None, expected=True):
+        files = []
+        for test in self._dataset if tests is None else tests:
+            files.append(test.input_path())
+            if expected and test.has_expected():
+                files.append(test.expected_path())
+        return files
+
+    def manifest(self):
+        """Return the manifest of the dataset revalidated against the files
+        currently in the directory."""
+        if self._manifest is None:
+            self._manifest = Manifest(self._dir_path)
+        self._manifest.refresh(self._files())
+        return self._manifest
+
+    def changed_tests(self, op, key=None, expected=True):
+        """Tests added or changed since the last time `op` was marked. If
+        `expected` is false only inputs are considered."""
+        changed = self.manifest().changed(op, self._files(expected=expected),
+                                          key)
+        return [test for test in self._dataset
+                if test.input_path() in changed or
+                test.expected_path() in changed]
+
+    def mark(self, op, tests, key=None, expected=True):
+        """Record that `op` processed `tests` in their current state."""
+        manifest = self.manifest()
+        manifest.mark(op, self._files(tests, expected), key)
+        manifest.save()
+
+    def remove(self, test):
+        """Delete the files of `test` and remove it from the dataset."""
+        os.remove(test.input_path())
+        if test.has_expected():
+            os.remove(test.expected_path())
+        self._dataset.remove(test)
+
+    def exact_duplicates(self):
+        """Return groups of tests with the same input.
+        Returns:
+          (list of list of TestData)
+        """
+        manifest = self.manifest()
+        return dedupe.exact_duplicates([(test,
+                                         manifest.hash(test.input_path()))
+                                        for test in self._dataset])
+
+    def near_duplicates(self, threshold, tests=None):
+        """Return pairs of tests whose inputs are similar.
+        Returns:
+          (list of (TestData, TestData, float))
+        """
+        tests = self._dataset if tests is None else tests
+        by_path = dict((test.input_path(), test) for test in tests)
+        return [(by_path[a], by_path[b], sim) for a, b, sim in
+                dedupe.near_duplicates([test.input_path() for test in tests],
+                                       threshold)]
+
+    def subtask(self, test):
+        """Subdirectory of the testdata directory holding `test`, or ''."""
+        return os.path.dirname(os.path.relpath(test.input_path(),
+                                               self._dir_path))
+
+    def stats_index(self):
+        if self._stats_index is None:
+            self._stats_index = stats.StatsIndex(self._dir_path)
+        return self._stats_index
+
+    def stats(self):
+        """Statistics of every test, reading only inputs that aren't in the
+        index.
+        Returns:
+          (list of (TestData, TestStats))
+        """
+        manifest = self.manifest()
+        index = self.stats_index()
+        result = [(test, index.stats(test.input_path(),
+                                     manifest.hash(test.input_path())))
+                  for test in self._dataset]
+        index.save(set(manifest.hash(test.input_path())
+                       for test in self._dataset))
+        return result
+
+    def input_hash(self, test):
+        """Hash of the input of `test`, which may also be a sample, without
+        reading it again if the manifest has it."""
+        if self._manifest is None:
+            self._manifest = Manifest(self._dir_path)
+        return self._manifest.lookup(test.input_path())
+
+    def cached_stats(self, test):
+        """Statistics of `test` if they are in the index, or None."""
+        if test not in self:
+            return None
+        return self.stats_index().get(self.input_hash(test))
+
+    def normalize(self, force=False):
+        tests = self._dataset if force else self.changed_tests('normalize')
+        for test in tests:
             test.normalize()
+        self.mark('normalize', self._dataset)
 
-    def compress(self, dst_file=None):
-        tmpdir = mkdtemp()
+    def compress(self, dst_file=None, force=False):
+        """Compress the dataset in a zip file. Returns false if nothing
+        changed since the last time and the zip file wasn't generated."""
+        if not dst_file:
+            dst_file = os.path.join(self._dir_path, 'data.zip')
+        added, removed, changed = self.manifest().changes('compress',
+                                                          self._files())
+        if not force and os.path.isfile(dst_file) and \
+           not (added or removed or changed):
+            return False
+        # Entries are written one at a time, decompressing compressed tests
+        # on the fly.
+        tmp_file = dst_file + '.tmp'
         i = 1
         in_format = "%%0%dd.in" % (floor(log(len(self._dataset), 10)) + 1)
         sol_format = "%%0%dd.sol" % (floor(log(len(self._dataset), 10)) + 1)
-        for test in self._dataset:
-            if test.has_expected():
-                in_name = in_format % i
-                sol_name = sol_format % i
-                shutil.copy2(test.input_path(), os.path.join(tmpdir, in_name))
-                shutil.copy2(test.expected_path(), os.path.join(tmpdir, sol_name))
-                i += 1
-        cmd_line = "cd %s && zip data.zip *.in *sol" % tmpdir
-        f = open('/dev/null', 'a')
-        subprocess.call(cmd_line, stdout=f, shell=True)
-        if not dst_file:
-            dst_file = os.path.join(self._dir_path, 'data.zip')
-        shutil.copy2(os.path.join(tmpdir, 'data.zip'), dst_file)
-        shutil.rmtree(tmpdir)
+        with zipfile.ZipFile(tmp_file, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for test in self._dataset:
+                if test.has_expected():
+                    for src_path, name in [(test.input_path(), in_format % i),
+                                           (test.expected_path(),
+                                            sol_format % i)]:
+                        with compression.open_file(src_path) as src, \
+                                zip_file.open(name, 'w',
+                                              force_zip64=True) as dst:
+                            shutil.copyfileobj(src, dst, 1 << 20)
+                    i += 1
+        os.replace(tmp_file, dst_file)
+        self.mark('compress', self._dataset)
+        return True
 
 
 class TestData:
@@ -299,31 +1156,49 @@ class TestData:
     expected_ext = '.sol'
 
     def __init__(self, basename_path):
+        """Inputs and expected outputs may be compressed (see
+        compression.py)."""
         self._basename_path = basename_path
-        self._input_path = basename_path + TestData.input_ext
-        self._expected_path = basename_path + TestData.expected_ext
-        assert os.path.isfile(self._input_path)
+        self._input_path = compression.find(basename_path +
+                                            TestData.input_ext)
+        assert self._input_path
 
     def __str__(self):
         return self._input_path
 
     def normalize(self):
-        tounix_input = "dos2unix \"%s\"" % self.input_path()
-        tounix_expected = "dos2unix \"%s\"" % self.expected_path()
-        cmd_input = "sed -i -e '$a\\' \"%s\"" % self.input_path()
-        cmd_expected = "sed -i -e '$a\\' \"%s\"" % self.expected_path()
-        f = open('/dev/null', 'a')
-        subprocess.call(tounix_input, stdout=f, shell=True)
-        subprocess.call(cmd_input, stdout=f, shell=True)
+        # Compressed files can't be edited in place.
+        paths = [self.input_path()]
         if self.has_expected():
-          subprocess.call(tounix_expected, stdout=f, shell=True)
-          subprocess.call(cmd_expected, stdout=f, shell=True)
+            paths.append(self.expected_path())
+        f = open('/dev/null', 'a')
+        for file_path in paths:
+            if not compression.suffix(file_path):
+                subprocess.call("dos2unix \"%s\"" % file_path, stdout=f,
+                                shell=True)
+                subprocess.call("sed -i -e '$a\\' \"%s\"" % file_path,
+                                stdout=f, shell=True)
 
     def input_path(self):
         return self._input_path
 
     def expected_path(self):
-        return self._expected_path
+        """Path of the expected output, compressed like the input when it
+        doesn't exist yet."""
+        plain_path = self._basename_path + TestData.expected_ext
+        return compression.find(plain_path) or \
+            plain_path + compression.suffix(self._input_path)
 
     def has_expected(self):
-        return os.path.isfile(self._expected_path)
+        return os.path.isfile(self.expected_path())
+
+    def is_compressed(self):
+        return bool(compression.suffix(self._input_path))
+
+    def input_stream(self, as_path=False):
+        """See `compression.stream`."""
+        return compression.stream(self._input_path, as_path)
+
+    def expected_stream(self, as_path=False):
+        """See `compression.stream`."""
+        return compression.stream(self.expected_path(), as_path)
@@ -0,0 +1,114 @@
+"""Duplicate and near-duplicate detection for test inputs.
+
+Exact duplicates are found by content hash. Near duplicates are found with
+one-permutation MinHash sketches over shingles of consecutive tokens: each
+file is read once in chunks, every shingle is hashed once, and only the
+sketch (`k` integers) is kept, so memory doesn't depend on the size of the
+files. Candidate pairs come from locality sensitive hashing over bands of
+the sketches instead of comparing every pair, and are then verified with
+the estimated Jaccard similarity.
+"""
+from collections import defaultdict
+
+from .compression import open_file
+
+EMPTY = 1 << 64
+
+
+def tokens(file_path, chunk_size=1 << 20):
+    """Yield the whitespace separated tokens of a file reading it in chunks.
+    Compressed files are decompressed on the fly."""
+    with open_file(file_path) as token_file:
+        carry = b''
+        for chunk in iter(lambda: token_file.read(chunk_size), b''):
+            parts = (carry + chunk).split()
+            # The last token may continue in the next chunk.
+            if chunk[-1:].isspace():
+                carry = b''
+            else:
+                carry = parts.pop() if parts else b''
+            for part in parts:
+                yield part
+        if carry:
+            yield carry
+
+
+def sketch(file_path, k=128, shingle=3):
+    """Return the one-permutation MinHash sketch of the shingles of `shingle`
+    consecutive tokens of the file. Each shingle hash falls in one of `k`
+    bins, which keeps its minimum. Sketches are only comparable within a
+    process."""
+    bins = [EMPTY] * k
+    window = ()
+    full = False
+    for token in tokens(file_path):
+        window = (window + (token,))[-shingle:]
+        if len(window) < shingle:
+            continue
+        full = True
+        value = hash(window) & (EMPTY - 1)
+        b, value = value % k, value // k
+        if value < bins[b]:
+            bins[b] = value
+    if not full and window:
+        # Files shorter than a shingle are a single shingle.
+        value = hash(window) & (EMPTY - 1)
+        bins[value % k] = value // k
+    return bins
+
+
+def similarity(sketch_a, sketch_b):
+    """Estimate the Jaccard similarity of two files from their sketches."""
+    used = 0
+    equal = 0
+    for a, b in zip(sketch_a, sketch_b):
+        if a == EMPTY and b == EMPTY:
+            continue
+        used += 1
+        equal += a == b
+    return equal / float(used) if used else 1.0
+
+
+def exact_duplicates(hashes):
+    """Group paths by content hash.
+    Args:
+      hashes (list of (path, hash))
+    Returns:
+      (list of list of path) groups with more than one path, in input order.
+    """
+    groups = defaultdict(list)
+    for path, content_hash in hashes:
+        groups[content_hash].append(path)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def near_duplicates(paths, threshold=0.9, k=128, rows=8):
+    """Find pairs of files whose estimated Jaccard similarity is at least
+    `threshold` (and less than 1, exact duplicates should be removed first).
+    Sketches are split in bands of `rows` bins; files agreeing on a whole
+    band are candidates. With the defaults, pairs with similarity above 0.7
+    are very likely to be candidates.
+    Returns:
+      (list of (path, path, similarity))
+    """
+    sketches = [sketch(path, k) for path in paths]
+    buckets = defaultdict(list)
+    for i, bins in enumerate(sketches):
+        for start in range(0, k, rows):
+            band = tuple(bins[start:start + rows])
+            if all(v == EMPTY for v in band):
+                continue
+            buckets[(start, band)].append(i)
+
+    candidates = set()
+    for files in buckets.values():
+        for x in range(len(files)):
+            for y in range(x + 1, len(files)):
+                candidates.add((files[x], files[y]))
+
+    pairs = []
+    for i, j in sorted(candidates):
+        sim = similarity(sketches[i], sketches[j])
+        if sim >= threshold:
+            pairs.append((paths[i], paths[j], sim))
+    return pairs
@@ -0,0 +1,407 @@
+"""Distributed execution of `run` and `check`.
+
+The coordinator builds every solution locally and splits the work in jobs,
+one per (problem, solution, test). Workers connect over TCP and pull jobs
+one at a time. Binaries, inputs, expected outputs and checkers are
+identified by the sha256 of their content; workers fetch the ones they don't
+have and keep them in a local cache, so each file crosses the network once
+per worker. Messages are JSON objects, one per line:
+
+    worker -> {"op": "get"}
+    coord  -> {"job": {...}} | {"wait": seconds} | {"done": true}
+    worker -> {"op": "blob", "hash": HASH}
+    coord  -> {"size": N} followed by N raw bytes
+    worker -> {"op": "result", "id": ID, "status": ..., "time": ...,
+               "wall": ..., "memory": ..., "memory_exceeded": ...,
+               "output_exceeded": ...,
+               "outcome": ..., "error": ...}
+    coord  -> {"ok": true}
+
+Jobs are queued longest first according to the planner (see planner.py).
+Jobs leased by a worker that disconnects are handed to the next worker.
+Jobs that can't be moved to another machine (interactive problems,
+solutions without a self-contained build product) are run by the
+coordinator itself. Compressed inputs and expected outputs are shipped
+compressed and decompressed on the fly by the worker. Binaries are executed as they are, so workers must be
+binary compatible with the coordinator.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import threading
+import subprocess
+import socketserver
+from collections import deque
+from contextlib import nullcontext
+from tempfile import mkdtemp
+
+from .core import TaskResult, grade, file_hash
+from .source import run, DiffChecker, CustomChecker, PersistentChecker
+from . import planner
+from . import compression
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    try:
+        return host or 'localhost', int(port)
+    except ValueError:
+        raise ValueError('Invalid address `%s`, expected HOST:PORT.' % address)
+
+
+def _send(wfile, msg):
+    wfile.write((json.dumps(msg) + '\n').encode())
+    wfile.flush()
+
+
+def _recv(rfile):
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line.decode())
+
+
+class Job:
+    def __init__(self, job_id, spec):
+        self.id = job_id
+        self.spec = spec
+        self.result = None
+        self.finished = threading.Event()
+
+
+class JobQueue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._jobs = {}
+        self._blobs = {}
+
+    def add_blob(self, file_path):
+        blob_hash = file_hash(file_path)
+        with self._lock:
+            self._blobs[blob_hash] = file_path
+        return blob_hash
+
+    def blob_path(self, blob_hash):
+        with self._lock:
+            return self._blobs.get(blob_hash)
+
+    def add(self, spec):
+        with self._lock:
+            job = Job(len(self._jobs), spec)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            return job
+
+    def lease(self):
+        """Return (job, done). job is None if there is nothing to hand out,
+        done tells whether every job has finished."""
+        with self._lock:
+            while self._pending:
+                job = self._pending.popleft()
+                if not job.finished.is_set():
+                    return job, False
+            return None, all(j.finished.is_set() for j in self._jobs.values())
+
+    def release(self, job_ids):
+        """Put back leased jobs that didn't finish."""
+        with self._lock:
+            for job_id in job_ids:
+                job = self._jobs[job_id]
+                if not job.finished.is_set():
+                    self._pending.appendleft(job)
+
+    def finish(self, job_id, result):
+        with self._lock:
+            job = self._jobs[job_id]
+            if not job.finished.is_set():
+                job.result = result
+                job.finished.set()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        queue = self.server.queue
+        leased = set()
+        try:
+            while True:
+                msg = _recv(self.rfile)
+                if msg is None:
+                    break
+                if msg['op'] == 'get':
+                    job, done = queue.lease()
+                    if job:
+                        leased.add(job.id)
+                        _send(self.wfile, {'job': dict(job.spec, id=job.id)})
+                    elif done:
+                        _send(self.wfile, {'done': True})
+                    else:
+                        _send(self.wfile, {'wait': 0.5})
+                elif msg['op'] == 'blob':
+                    self._send_blob(queue.blob_path(msg['hash']))
+                elif msg['op'] == 'result':
+                    queue.finish(msg['id'], msg)
+                    leased.discard(msg['id'])
+                    _send(self.wfile, {'ok': True})
+        except (OSError, ValueError):
+            pass
+        finally:
+            queue.release(leased)
+
+    def _send_blob(self, file_path):
+        if file_path is None:
+            _send(self.wfile, {'size': -1})
+            return
+        _send(self.wfile, {'size': os.path.getsize(file_path)})
+        with open(file_path, 'rb') as blob_file:
+            shutil.copyfileobj(blob_file, self.wfile)
+        self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Coordinator:
+    def __init__(self, address, local_workers=0, planner=None):
+        self._address = parse_address(address)
+        self._local_workers = local_workers
+        self._planner = planner
+        self._queue = JobQueue()
+
+    def _job_spec(self, problem, solution, test):
+        """Describe the job of running `solution` on `test`, or return None
+        if it must be run locally."""
+        if problem.is_interactive() or not test.has_expected():
+            return None
+        artifact = solution.artifact()
+        if not artifact:
+            return None
+        bin_path, argv = artifact
+        checker = problem.checker()
+        spec = {
+            'bin': self._queue.add_blob(bin_path),
+            'argv': argv,
+            'input': self._queue.add_blob(test.input_path()),
+            'expected': self._queue.add_blob(test.expected_path()),
+            'input_compression': compression.suffix(test.input_path()),
+            'expected_compression': compression.suffix(test.expected_path()),
+            'checker': None,
+            'checker_mode': 'diff',
+            'startup': solution.startup_time(),
+            'memory_limit': problem.memory_limit(),
+            'output_limit': problem.output_limit(test),
+        }
+        if isinstance(checker, (CustomChecker, PersistentChecker)):
+            spec['checker'] = self._queue.add_blob(checker.file_path())
+            spec['checker_mode'] = ('persistent'
+                                    if isinstance(checker, PersistentChecker)
+                                    else 'custom')
+        return spec
+
+    def run(self, problems, solution_callback, start_callback, end_callback,
+            partial, sample, formatter, status_fun):
+        # Build and enqueue everything first so workers can start right away.
+        plan = []
+        specs = {}
+        for problem in problems:
+            for solution in problem.solutions(partial):
+                tests = [test for test in problem.tests(sample)
+                         if problem.selected(solution, test)]
+                if not tests:
+                    continue
+                built = not solution.need_rebuilt() or solution.build()
+                if built:
+                    for test in tests:
+                        spec = self._job_spec(problem, solution, test)
+                        if spec:
+                            specs[(problem, solution, test)] = spec
+                plan.append((problem, solution, tests, built))
+        # Workers pull the longest jobs first.
+        movable = list(specs)
+        if self._planner:
+            movable = [(job.problem, job.solution, job.test) for job in
+                       planner.longest_first(self._planner.plan(movable))]
+        queued = dict((key, self._queue.add(specs[key])) for key in movable)
+        plan = [(problem, solution,
+                 [(test, queued.get((problem, solution, test)))
+                  for test in tests], built)
+                for problem, solution, tests, built in plan]
+
+        server = _Server(self._address, _Handler)
+        server.queue = self._queue
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        workers = [spawn_local_worker('%s:%d' % server.server_address)
+                   for _ in range(self._local_workers)]
+        try:
+            for problem, solution, jobs, built in plan:
+                solution_callback(problem, problem.solution_label(solution))
+                for test, job in jobs:
+                    start_callback(str(test))
+                    if not built:
+                        result = TaskResult('Build failed', False)
+                        problem.report(solution, test, result)
+                        end_callback(result)
+                        continue
+                    if job is None:
+                        end_callback(problem.judge(solution, test, formatter,
+                                                   status_fun))
+                        continue
+                    job.finished.wait()
+                    result = self._result(job.result, formatter, status_fun)
+                    if not job.result.get('error'):
+                        problem.record(solution, test, result,
+                                       job.result['time'], job.result['wall'],
+                                       job.result['memory'])
+                        problem.report(solution, test, result,
+                                       job.result['time'],
+                                       job.result['memory'])
+                    else:
+                        problem.report(solution, test, result)
+                    end_callback(result)
+        finally:
+            server.shutdown()
+            server.server_close()
+            for worker in workers:
+                worker.wait()
+            for problem in problems:
+                problem.checker().close()
+
+    def _result(self, msg, formatter, status_fun):
+        if msg.get('error'):
+            return TaskResult(msg['error'], False)
+        return grade(msg['status'], msg['time'], msg['outcome'], formatter,
+                     status_fun, msg['memory'], msg['memory_exceeded'],
+                     msg['output_exceeded'])
+
+
+def spawn_local_worker(address):
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [package_root] + [p for p in [env.get('PYTHONPATH')] if p])
+    return subprocess.Popen([sys.executable, '-m', 'ocimatic.distributed',
+                             address], env=env)
+
+
+def default_cache_path():
+    return os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                       os.path.expanduser('~/.cache')),
+                        'ocimatic', 'blobs')
+
+
+class Worker:
+    def __init__(self, address, cache_path=None):
+        self._address = parse_address(address)
+        self._cache_path = cache_path or default_cache_path()
+        self._checkers = {}
+        os.makedirs(self._cache_path, exist_ok=True)
+
+    def work(self):
+        with socket.create_connection(self._address) as conn:
+            self._rfile = conn.makefile('rb')
+            self._wfile = conn.makefile('wb')
+            try:
+                while True:
+                    _send(self._wfile, {'op': 'get'})
+                    msg = _recv(self._rfile)
+                    if msg is None or msg.get('done'):
+                        break
+                    if 'wait' in msg:
+                        time.sleep(msg['wait'])
+                        continue
+                    result = self._execute(msg['job'])
+                    _send(self._wfile, dict(result, op='result',
+                                            id=msg['job']['id']))
+                    _recv(self._rfile)
+            finally:
+                for checker in self._checkers.values():
+                    checker.close()
+
+    def _blob(self, blob_hash):
+        """Return the path of the blob in the local cache, fetching it from the
+        coordinator if needed."""
+        blob_path = os.path.join(self._cache_path, blob_hash)
+        if os.path.isfile(blob_path):
+            return blob_path
+        _send(self._wfile, {'op': 'blob', 'hash': blob_hash})
+        size = _recv(self._rfile)['size']
+        if size < 0:
+            raise Exception('Unknown blob %s' % blob_hash)
+        tmp_path = '%s.%d.tmp' % (blob_path, os.getpid())
+        with open(tmp_path, 'wb') as blob_file:
+            while size > 0:
+                chunk = self._rfile.read(min(size, 1 << 20))
+                if not chunk:
+                    raise Exception('Connection closed')
+                blob_file.write(chunk)
+                size -= len(chunk)
+        os.chmod(tmp_path, 0o755)
+        os.replace(tmp_path, blob_path)
+        return blob_path
+
+    def _checker(self, job):
+        if job['checker_mode'] == 'diff':
+            return DiffChecker()
+        checker_path = self._blob(job['checker'])
+        if job['checker_mode'] == 'custom':
+            return CustomChecker(checker_path)
+        if checker_path not in self._checkers:
+            self._checkers[checker_path] = PersistentChecker(checker_path)
+        return self._checkers[checker_path]
+
+    def _execute(self, job):
+        tmpdir = mkdtemp()
+        try:
+            bin_path = self._blob(job['bin'])
+            in_path = self._blob(job['input'])
+            expected_path = self._blob(job['expected'])
+            checker = self._checker(job)
+            out_path = os.path.join(tmpdir, 'out')
+            argv = [bin_path if arg == '{}' else arg for arg in job['argv']]
+            cmd = shutil.which(argv[0]) or argv[0]
+            wall_start = time.perf_counter()
+            # As in `Problem.judge`, with the default checker the output is
+            # compared while the solution runs.
+            expected_file = nullcontext()
+            if job['checker_mode'] == 'diff':
+                expected_file = compression.open_file(
+                    expected_path, job['expected_compression'])
+            in_stream = compression.stream(
+                in_path, compression=job['input_compression'])
+            with in_stream as in_source, expected_file as expected:
+                usage = run(cmd, in_source, out_path, *argv[1:],
+                            memory_limit=job['memory_limit'],
+                            output_limit=job['output_limit'],
+                            expected=expected)
+            wall_time = time.perf_counter() - wall_start
+            wtime = max(usage.time - job['startup'], 0.0)
+            outcome = None
+            if usage.matches is not None:
+                outcome = 1.0 if usage.matches else 0.0
+            elif usage.status:
+                with compression.stream(
+                        in_path, True, job['input_compression']) as in_stream, \
+                        compression.stream(
+                            expected_path, True,
+                            job['expected_compression']) as expected_stream:
+                    outcome = checker(in_stream, expected_stream, out_path)
+            return {'status': usage.status, 'time': wtime, 'wall': wall_time,
+                    'memory': usage.memory,
+                    'memory_exceeded': usage.memory_exceeded,
+                    'output_exceeded': usage.output_exceeded,
+                    'outcome': outcome, 'error': None}
+        except Exception as exc:
+            return {'status': False, 'time': 0.0, 'outcome': None,
+                    'error': str(exc)}
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    Worker(sys.argv[1]).work()
@@ -0,0 +1,107 @@
+"""Conversion of statement figures.
+
+pdflatex can't include EPS figures by itself: the epstopdf package converts
+each one to `<name>-eps-converted-to.pdf` next to it while compiling, again
+on every pass and for every statement. Instead, figures are converted before
+LaTeX runs, in parallel, and the results are kept in a cache shared by the
+whole contest and keyed by the content of the figure, so a figure is only
+converted when its content wasn't seen before. `Latex.compile` tells
+epstopdf to reuse converted files newer than their figure.
+"""
+import os
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .manifest import file_hash
+from . import trace
+
+CACHE_DIR = os.path.join('.ocimatic-cache', 'figures')
+
+# Converters by extension: a function returning the command line that
+# converts a source path into a destination path, and the suffix epstopdf
+# gives to the converted file.
+CONVERTERS = {
+    '.eps': (lambda src, dst: ['epstopdf', '--outfile=%s' % dst, src],
+             '-eps-converted-to.pdf'),
+}
+
+
+def converted_path(figure_path):
+    """Path where LaTeX looks for the converted figure."""
+    base, ext = os.path.splitext(figure_path)
+    return base + CONVERTERS[ext.lower()][1]
+
+
+def _same_file(path_a, path_b):
+    return os.path.isfile(path_a) and file_hash(path_a) == file_hash(path_b)
+
+
+class FigureCache:
+    def __init__(self, dir_path):
+        self._dir_path = dir_path
+
+    def _tmp_path(self, file_path):
+        return '%s.%d.%d.tmp' % (file_path, os.getpid(), threading.get_ident())
+
+    def convert(self, figure_path):
+        """Put the PDF version of `figure_path` next to it, converting the
+        figure only if its content isn't in the cache.
+        Returns:
+          (bool) whether it succeeded.
+        """
+        ext = os.path.splitext(figure_path)[1].lower()
+        cached_path = os.path.join(self._dir_path,
+                                   file_hash(figure_path) + '.pdf')
+        if not os.path.isfile(cached_path):
+            os.makedirs(self._dir_path, exist_ok=True)
+            tmp_path = self._tmp_path(cached_path)
+            with trace.span('figure', 'latex', figure=figure_path) as span, \
+                    open('/dev/null', 'w') as null:
+                try:
+                    status = subprocess.call(
+                        CONVERTERS[ext][0](figure_path, tmp_path),
+                        stdout=null, stderr=null) == 0
+                except OSError:
+                    status = False
+                span.set(status=status)
+            if not status or not os.path.isfile(tmp_path):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return False
+            os.replace(tmp_path, cached_path)
+
+        dst_path = converted_path(figure_path)
+        if _same_file(dst_path, cached_path) and \
+           os.path.getmtime(dst_path) >= os.path.getmtime(figure_path):
+            return True
+        # A fresh copy is newer than the figure, so epstopdf won't convert it
+        # again.
+        tmp_path = self._tmp_path(dst_path)
+        shutil.copyfile(cached_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+        return True
+
+    def convert_all(self, figure_paths, jobs=None):
+        """Convert figures in parallel.
+        Returns:
+          (list of string) paths of the figures that couldn't be converted.
+        """
+        # Figures with the same content are converted once, the others are
+        # then served from the cache.
+        groups = {}
+        for figure_path in sorted(set(figure_paths)):
+            groups.setdefault(file_hash(figure_path), []).append(figure_path)
+        with ThreadPoolExecutor(jobs) as executor:
+            converted = list(executor.map(self.convert,
+                                          [group[0] for group in
+                                           groups.values()]))
+        failed = []
+        for group, status in zip(groups.values(), converted):
+            if not status:
+                failed += group
+            else:
+                failed += [figure_path for figure_path in group[1:]
+                           if not self.convert(figure_path)]
+        return failed
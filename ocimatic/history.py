@@ -0,0 +1,208 @@
+"""History of run results.
+
+Every `run` and `check` is recorded in a per-contest SQLite database so
+timings can be compared across runs. Like tracing, recording is module
+state: `record` is a no-op until `start` is called.
+
+Each result is committed as soon as it's recorded, so runs in several
+shells of the same contest only hold the database lock for an insert. If
+the database can't be written the run goes on without history.
+"""
+import sys
+import math
+import socket
+import sqlite3
+import threading
+import time
+
+DB_NAME = '.ocimatic-history.sqlite'
+
+# Seconds to wait for another process holding the database lock.
+BUSY_TIMEOUT = 30
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    action TEXT NOT NULL,
+    host TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    problem TEXT NOT NULL,
+    solution TEXT NOT NULL,
+    binary_hash TEXT,
+    test TEXT NOT NULL,
+    input_hash TEXT,
+    verdict TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    cpu_time REAL,
+    wall_time REAL,
+    host TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    memory INTEGER
+);
+CREATE INDEX IF NOT EXISTS results_run ON results(run_id);
+'''
+
+# One-sided 95% quantiles of Student's t distribution by degrees of freedom.
+T_95 = [6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+        1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+        1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697]
+
+_history = None
+_warn_fun = None
+
+
+class History:
+    def __init__(self, db_path):
+        # Without an implicit transaction every statement commits on its
+        # own.
+        self._conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+        self._host = socket.gethostname()
+        self._run_id = None
+
+    def _migrate(self):
+        """Add the columns introduced after a database was created."""
+        columns = [row[1] for row in
+                   self._conn.execute('PRAGMA table_info(results)')]
+        if 'memory' not in columns:
+            self._conn.execute('ALTER TABLE results ADD COLUMN memory INTEGER')
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def start_run(self, action):
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT INTO runs (action, host, timestamp) VALUES (?, ?, ?)',
+                (action, self._host, time.time()))
+            self._conn.commit()
+            self._run_id = cursor.lastrowid
+        return self._run_id
+
+    def record(self, problem, solution, binary_hash, test, input_hash,
+               verdict, status, cpu_time, wall_time, memory=None):
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO results (run_id, problem, solution, binary_hash,'
+                ' test, input_hash, verdict, status, cpu_time, wall_time,'
+                ' host, timestamp, memory)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (self._run_id, problem, solution, binary_hash, test,
+                 input_hash, verdict, int(bool(status)), cpu_time, wall_time,
+                 self._host, time.time(), memory))
+
+    def runs(self, limit=20):
+        """Return the last runs as (id, action, host, timestamp, results)."""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT runs.id, action, runs.host, runs.timestamp,'
+                ' COUNT(results.run_id) FROM runs'
+                ' LEFT JOIN results ON results.run_id = runs.id'
+                ' GROUP BY runs.id ORDER BY runs.id DESC LIMIT ?',
+                (limit,)).fetchall()
+
+    def times(self, run_id, problems=None):
+        """Return {(problem, solution): {input_hash: cpu_time}} for the
+        successful results of a run."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT problem, solution, input_hash, cpu_time FROM results'
+                ' WHERE run_id = ? AND status = 1 AND cpu_time IS NOT NULL',
+                (run_id,)).fetchall()
+        times = {}
+        for problem, solution, input_hash, cpu_time in rows:
+            if problems is None or problem in problems:
+                times.setdefault((problem, solution), {})[input_hash] = cpu_time
+        return times
+
+    def latest_times(self, problems=None):
+        """Return {(problem, solution, input_hash): time} with the wall time
+        (or cpu time if unknown) of the last result of each solution on each
+        input, whatever its verdict."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT problem, solution, input_hash,'
+                ' COALESCE(wall_time, cpu_time) FROM results'
+                ' WHERE COALESCE(wall_time, cpu_time) IS NOT NULL'
+                ' ORDER BY rowid').fetchall()
+        return dict(((problem, solution, input_hash), elapsed)
+                    for problem, solution, input_hash, elapsed in rows
+                    if problems is None or problem in problems)
+
+    def compare(self, baseline_id, run_id, problems=None, threshold=0.05,
+                resolution=0.001):
+        """Compare the time of each solution in `run_id` against `baseline_id`
+        pairing tests by input hash. A slowdown is flagged when the mean log
+        ratio of times is larger than `threshold` and significant according
+        to a one-sided paired t-test at 95%. `resolution` is added to every
+        time so tests near the timer resolution don't dominate.
+        Returns:
+          (list of (problem, solution, tests, ratio, significant))
+        """
+        baseline = self.times(baseline_id, problems)
+        current = self.times(run_id, problems)
+        report = []
+        for key in sorted(current):
+            old = baseline.get(key, {})
+            ratios = [math.log((current[key][h] + resolution) /
+                               (old[h] + resolution))
+                      for h in current[key] if h in old]
+            if not ratios:
+                continue
+            n = len(ratios)
+            mean = sum(ratios) / n
+            significant = False
+            if n >= 2 and mean > math.log(1 + threshold):
+                var = sum((r - mean) ** 2 for r in ratios) / (n - 1)
+                t_crit = T_95[n - 2] if n - 2 < len(T_95) else 1.645
+                significant = var == 0 or mean / math.sqrt(var / n) > t_crit
+            report.append(key + (n, math.exp(mean), significant))
+        return report
+
+
+def _warn(msg):
+    sys.stderr.write('Warning: %s\n' % msg)
+
+
+def start(db_path, action, warn=_warn):
+    """Start recording a run of `action`. If the database can't be opened
+    `warn` is called with the reason and nothing is recorded."""
+    global _history, _warn_fun
+    _warn_fun = warn
+    try:
+        _history = History(db_path)
+        _history.start_run(action)
+    except sqlite3.Error as exc:
+        _history = None
+        warn('Not recording the history: %s' % exc)
+    return _history
+
+
+def stop():
+    global _history
+    if _history is not None:
+        try:
+            _history.close()
+        except sqlite3.Error:
+            pass
+        _history = None
+
+
+def record(*args):
+    db = _history
+    if db is not None:
+        try:
+            db.record(*args)
+        except sqlite3.Error as exc:
+            _warn_fun('Stopped recording the history: %s' % exc)
+            stop()
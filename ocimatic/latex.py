@@ -6,6 +6,9 @@ import os
 from os import path
 from tempfile import mkdtemp
 
+from . import trace
+from . import figures
+
 
 def copytree(src, dst, symlinks=False, ignore=None):
     for item in os.listdir(src):
@@ -87,17 +90,25 @@ class Latex:
 
 
     def compile(self):
-        cmd_line = 'cd %s && pdflatex --shell-escape %s %s' % (self._dir_path,
-                                                               '-interaction=batchmode',
-                                                               # '',
-                                                               self._file_path)
+        # With `update` epstopdf doesn't convert figures already converted
+        # (see figures.py).
+        jobname, _ = path.splitext(self._filename)
+        cmd_line = 'cd %s && pdflatex --shell-escape %s -jobname=%s %s' % (
+            self._dir_path,
+            '-interaction=batchmode',
+            # '',
+            jobname,
+            "'\\PassOptionsToPackage{update}{epstopdf-base}"
+            "\\input{%s}'" % self._file_path)
 
         # We run latex multiple times just to be sure all is in place
         f = open('/dev/null', 'a')
         # f = open('/dev/stdout', 'w')
-        st = subprocess.call(cmd_line, stdout=f, shell=True) == 0
-        st = st and subprocess.call(cmd_line, stdout=f, shell=True) == 0
-        st = st and subprocess.call(cmd_line, stdout=f, shell=True) == 0
+        with trace.span('latex', 'latex', file=self._file_path) as span:
+            st = subprocess.call(cmd_line, stdout=f, shell=True) == 0
+            st = st and subprocess.call(cmd_line, stdout=f, shell=True) == 0
+            st = st and subprocess.call(cmd_line, stdout=f, shell=True) == 0
+            span.set(status=st)
         return st
 
 
@@ -134,6 +145,32 @@ class Latex:
         latex_file.close()
         return packages
 
+    def document_class(self):
+        latex_file = open(self._file_path, 'r')
+        for line in latex_file:
+            m = re.search(r'^\\documentclass(\[[^\]]*\])?{([^}]*)}', line)
+            if m:
+                latex_file.close()
+                return m.group(2)
+        latex_file.close()
+        return None
+
+    def figures(self):
+        """Return the paths of the figures included in the document, or in its
+        class if it's next to it (e.g. the logo in the header), that must be
+        converted to PDF."""
+        refs = self.referenced_files()
+        cls_path = path.join(self._dir_path, '%s.cls' % self.document_class())
+        if path.isfile(cls_path):
+            refs += Latex(cls_path).referenced_files()
+        figure_paths = []
+        for ref in sorted(set(refs)):
+            figure_path = path.join(self._dir_path, ref)
+            if path.splitext(ref)[1].lower() in figures.CONVERTERS and \
+               path.isfile(figure_path):
+                figure_paths.append(figure_path)
+        return figure_paths
+
     def referenced_files(self):
         """Return relative path to files referenced inside the document"""
         latex_file = open(self._file_path, 'r')
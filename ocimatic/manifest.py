@@ -0,0 +1,127 @@
+"""Dataset manifest.
+
+The manifest stores the size, modification time and content hash of every
+file in a testdata directory, plus a snapshot of the hashes seen by each
+operation (compress, normalize, expected, check) the last time it ran. It
+lets those operations process only what was added or changed since.
+Revalidation only hashes files whose size or modification time changed.
+"""
+import os
+import json
+import hashlib
+import threading
+
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
+def file_hash(file_path):
+    """Return the sha256 of the content of `file_path`. Hashes are memoized
+    while the size and modification time of the file don't change."""
+    st = os.stat(file_path)
+    key = (file_path, st.st_mtime_ns, st.st_size)
+    with _hashes_lock:
+        if key in _hashes:
+            return _hashes[key]
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(1 << 20), b''):
+            sha.update(chunk)
+    with _hashes_lock:
+        _hashes[key] = sha.hexdigest()
+    return _hashes[key]
+
+
+class Manifest:
+    file_name = '.ocimatic-manifest.json'
+
+    def __init__(self, dir_path):
+        self._dir_path = dir_path
+        self._file_path = os.path.join(dir_path, self.file_name)
+        self._files = {}
+        self._ops = {}
+        try:
+            with open(self._file_path, 'r') as manifest_file:
+                data = json.load(manifest_file)
+            self._files = data.get('files', {})
+            self._ops = data.get('ops', {})
+        except (OSError, ValueError):
+            pass
+
+    def _relpath(self, file_path):
+        return os.path.relpath(file_path, self._dir_path)
+
+    def refresh(self, file_paths):
+        """Revalidate the entries of `file_paths` and forget any other file."""
+        files = {}
+        for file_path in file_paths:
+            rel = self._relpath(file_path)
+            st = os.stat(file_path)
+            entry = self._files.get(rel)
+            if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                files[rel] = entry
+            else:
+                files[rel] = [st.st_size, st.st_mtime_ns, file_hash(file_path)]
+        self._files = files
+
+    def hash(self, file_path):
+        return self._files[self._relpath(file_path)][2]
+
+    def lookup(self, file_path):
+        """Hash of `file_path`, taken from the manifest if the file's size and
+        modification time didn't change since it was recorded. Unlike
+        `refresh` only this file is looked at and the manifest isn't
+        modified."""
+        st = os.stat(file_path)
+        entry = self._files.get(self._relpath(file_path))
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        return file_hash(file_path)
+
+    def changes(self, op, file_paths, key=None):
+        """Compare `file_paths` against the snapshot of `op`. If `key` (e.g.
+        the hash of the program used by the operation) differs from the one
+        recorded, every file is considered added.
+        Returns:
+          (list, list, list) added, removed and changed paths.
+        """
+        snapshot = self._snapshot(op, key)
+        current = set(self._relpath(p) for p in file_paths)
+        added, changed = [], []
+        for file_path in file_paths:
+            rel = self._relpath(file_path)
+            if rel not in snapshot:
+                added.append(file_path)
+            elif snapshot[rel] != self._files[rel][2]:
+                changed.append(file_path)
+        removed = [os.path.join(self._dir_path, rel)
+                   for rel in sorted(snapshot) if rel not in current]
+        return added, removed, changed
+
+    def changed(self, op, file_paths, key=None):
+        """Paths of `file_paths` that were added or changed since `op`."""
+        added, _, changed = self.changes(op, file_paths, key)
+        return set(added + changed)
+
+    def mark(self, op, file_paths, key=None):
+        """Record that `op` processed `file_paths` in their current state."""
+        snapshot = self._snapshot(op, key)
+        snapshot = dict((rel, h) for rel, h in snapshot.items()
+                        if rel in self._files)
+        for file_path in file_paths:
+            rel = self._relpath(file_path)
+            snapshot[rel] = self._files[rel][2]
+        self._ops[op] = {'key': key, 'files': snapshot}
+
+    def _snapshot(self, op, key):
+        entry = self._ops.get(op)
+        if not entry or entry['key'] != key:
+            return {}
+        return entry['files']
+
+    def save(self):
+        tmp_path = self._file_path + '.tmp'
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump({'files': self._files, 'ops': self._ops}, manifest_file,
+                      indent=1, sort_keys=True)
+        os.replace(tmp_path, self._file_path)
@@ -0,0 +1,131 @@
+"""Planning of `run` and `check` jobs.
+
+Each job runs a solution on a test. Its cost is the last time recorded in
+the history for the same solution and input. Jobs without a record are
+estimated from the size of their input, using the seconds per byte observed
+for the same solution, or else the same problem or the whole history, or
+else `DEFAULT_RATE`. Sizes come from the statistics index of the dataset
+when available (see stats.py), which counts compressed inputs by their
+decompressed size.
+
+Jobs are then ordered by decreasing cost, longest processing time first.
+Handed to a pool of workers that take the next job when they are free, this
+order starts the slowest work first so a single long job doesn't stretch
+the end of the run.
+"""
+import os
+import heapq
+
+
+# Fallback cost: a fixed overhead per process plus time per input byte.
+DEFAULT_OVERHEAD = 0.005
+DEFAULT_RATE = 2e-8
+
+
+class Job:
+    def __init__(self, problem, solution, test, cost, known):
+        self.problem = problem
+        self.solution = solution
+        self.test = test
+        self.cost = cost
+        self.known = known
+
+
+class Planner:
+    def __init__(self, times=None):
+        """`times` is the result of `History.latest_times`."""
+        self._times = times or {}
+        self._rates = {}
+
+    def _rate(self, problem, solution):
+        """Seconds per input byte of `solution`, falling back to the rate of
+        its problem and then of every recorded job."""
+        if not self._rates:
+            totals = {}
+            for (p, s, input_hash), elapsed in self._times.items():
+                size = self._sizes.get(input_hash)
+                if not size:
+                    continue
+                for key in [(p, s), (p,), ()]:
+                    total = totals.setdefault(key, [0.0, 0])
+                    total[0] += max(elapsed - DEFAULT_OVERHEAD, 0.0)
+                    total[1] += size
+            self._rates = dict((key, t / size)
+                               for key, (t, size) in totals.items() if size)
+        for key in [(problem, solution), (problem,), ()]:
+            if key in self._rates:
+                return self._rates[key]
+        return DEFAULT_RATE
+
+    def plan(self, jobs):
+        """Estimate the cost of `jobs`, a list of (problem, solution, test).
+        Returns:
+          (list of Job) in the same order.
+        """
+        self._sizes = {}
+        keyed = []
+        for problem, solution, test in jobs:
+            input_hash = problem.input_hash(test)
+            input_stats = problem.input_stats(test)
+            self._sizes[input_hash] = (input_stats.size if input_stats else
+                                       os.path.getsize(test.input_path()))
+            keyed.append((problem, solution, test, input_hash))
+        self._rates = {}
+        planned = []
+        for problem, solution, test, input_hash in keyed:
+            key = (problem.name(), problem.solution_key(solution),
+                   input_hash)
+            if key in self._times:
+                planned.append(Job(problem, solution, test, self._times[key],
+                                   True))
+            else:
+                rate = self._rate(key[0], key[1])
+                planned.append(Job(problem, solution, test,
+                                   DEFAULT_OVERHEAD +
+                                   rate * self._sizes[input_hash], False))
+        return planned
+
+
+def longest_first(jobs):
+    """Order jobs by decreasing cost (stable for equal costs)."""
+    return sorted(jobs, key=lambda job: -job.cost)
+
+
+def makespan(jobs, workers):
+    """Predicted wall time of running `jobs` in the given order on `workers`
+    workers, each taking the next job as soon as it is free."""
+    loads = [0.0] * max(workers, 1)
+    for job in jobs:
+        heapq.heapreplace(loads, loads[0] + job.cost)
+    return max(loads)
+
+
+def by_size(jobs):
+    """Estimate the cost of `jobs`, a list of (problem, solution, test), from
+    the size of their input file alone, which unlike the history is the
+    same on every machine.
+    Returns:
+      (list of Job) in the same order.
+    """
+    return [Job(problem, solution, test,
+                DEFAULT_OVERHEAD +
+                DEFAULT_RATE * os.path.getsize(test.input_path()), False)
+            for problem, solution, test in jobs]
+
+
+def shard(jobs, count, key):
+    """Split `jobs` in `count` disjoint shards of similar cost, taking jobs
+    longest first and giving each one to the least loaded shard (the first
+    one on ties). `key` maps a job to a sortable value that breaks ties
+    between jobs of equal cost, so shards only depend on the jobs and not
+    on the order they are given.
+    Returns:
+      (list of list of Job)
+    """
+    shards = [[] for _ in range(count)]
+    loads = [(0.0, i) for i in range(count)]
+    for job in sorted(jobs, key=lambda job: (-job.cost, key(job))):
+        load, i = heapq.heappop(loads)
+        shards[i].append(job)
+        heapq.heappush(loads, (load + job.cost, i))
+    return shards
@@ -0,0 +1,69 @@
+/* Launcher used by ocimatic to run solutions (see source.py).
+ *
+ *   launcher MEMORY_LIMIT COMMAND [ARGS...]
+ *
+ * Runs COMMAND in a child process with standard input, output and error
+ * inherited, after limiting its data segment to MEMORY_LIMIT bytes (0 for no
+ * limit), and writes to file descriptor 3 a line with the wait status of the
+ * child, its user and system CPU time in seconds and its peak resident set
+ * size in kilobytes. The child is forked from this small process, so its
+ * peak memory doesn't include the memory of ocimatic. If the launcher is
+ * killed the child is killed too.
+ */
+#include <errno.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/resource.h>
+#include <sys/time.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+#ifdef __linux__
+#include <sys/prctl.h>
+#endif
+
+int main(int argc, char **argv) {
+    if (argc < 3) {
+        return 127;
+    }
+    long long limit = atoll(argv[1]);
+    pid_t parent = getpid();
+    pid_t pid = fork();
+    if (pid < 0) {
+        return 127;
+    }
+    if (pid == 0) {
+        close(3);
+#ifdef __linux__
+        prctl(PR_SET_PDEATHSIG, SIGKILL);
+        if (getppid() != parent) {
+            _exit(127);
+        }
+#endif
+        if (limit > 0) {
+            struct rlimit rl;
+            rl.rlim_cur = rl.rlim_max = (rlim_t)limit;
+            setrlimit(RLIMIT_DATA, &rl);
+        }
+        execv(argv[2], argv + 2);
+        _exit(127);
+    }
+    int status;
+    struct rusage ru;
+    while (wait4(pid, &status, 0, &ru) < 0) {
+        if (errno != EINTR) {
+            return 127;
+        }
+    }
+    FILE *report = fdopen(3, "w");
+    if (!report) {
+        return 127;
+    }
+    fprintf(report, "%d %ld.%06ld %ld.%06ld %ld\n", status,
+            (long)ru.ru_utime.tv_sec, (long)ru.ru_utime.tv_usec,
+            (long)ru.ru_stime.tv_sec, (long)ru.ru_stime.tv_usec,
+            (long)ru.ru_maxrss);
+    fclose(report);
+    return 0;
+}
@@ -0,0 +1,112 @@
+"""Machine readable results of `run` and `check`.
+
+With `--results FILE` the result of every solution on every test is saved
+to a JSON file:
+
+    {"action": "check", "shard": [1, 4], "results": [
+        {"problem": ..., "solution": ..., "test": ..., "verdict": ...,
+         "status": ..., "correct": ..., "time": ..., "memory": ...}, ...]}
+
+Paths are relative to the contest root so files written on different
+machines can be combined. `merge` combines the files of the shards of a
+run (see `planner.shard`) into a single report. Nothing is written unless
+`--results` is given, and the file is only replaced once the run ends.
+"""
+import os
+import json
+import threading
+
+_results = None
+
+
+class Results:
+    def __init__(self, file_path, action, shard=None):
+        self._file_path = file_path
+        self._action = action
+        self._shard = shard
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def record(self, problem, solution, test, verdict, status, correct,
+               time=None, memory=None):
+        with self._lock:
+            self._entries.append({
+                'problem': problem, 'solution': solution, 'test': test,
+                'verdict': verdict, 'status': status, 'correct': correct,
+                'time': time, 'memory': memory})
+
+    def save(self):
+        tmp_path = self._file_path + '.tmp'
+        with self._lock, open(tmp_path, 'w') as results_file:
+            json.dump({'action': self._action,
+                       'shard': list(self._shard) if self._shard else None,
+                       'results': self._entries},
+                      results_file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self._file_path)
+
+
+def start(file_path, action, shard=None):
+    global _results
+    _results = Results(file_path, action, shard)
+    return _results
+
+
+def stop():
+    global _results
+    if _results is not None:
+        _results.save()
+        _results = None
+
+
+def record(*args, **kwargs):
+    if _results is not None:
+        _results.record(*args, **kwargs)
+
+
+def failed(entry):
+    """Whether a result counts as a failure: a correct solution that didn't
+    pass. Partial solutions are expected to fail."""
+    return entry['correct'] and not entry['status']
+
+
+def merge(file_paths):
+    """Combine the results of the shards of a run.
+    Returns:
+      (list of dict, list of string) the results sorted by problem,
+      solution and test, and the problems found with the set of shards
+      (missing shards, shards of different sizes or actions).
+    """
+    entries = []
+    problems = []
+    shards = set()
+    counts = set()
+    actions = set()
+    for file_path in file_paths:
+        try:
+            with open(file_path, 'r') as results_file:
+                data = json.load(results_file)
+        except (OSError, ValueError) as exc:
+            problems.append('Can\'t read %s: %s' % (file_path, exc))
+            continue
+        actions.add(data.get('action'))
+        if data.get('shard'):
+            index, count = data['shard']
+            if index in shards:
+                problems.append('Shard %d/%d appears twice' % (index, count))
+            shards.add(index)
+            counts.add(count)
+        entries += data.get('results', [])
+    if len(actions) > 1:
+        problems.append('Results of different actions: %s' %
+                        ', '.join(sorted(str(a) for a in actions)))
+    if len(counts) > 1:
+        problems.append('Shards of different runs: %s' %
+                        ', '.join('/%d' % c for c in sorted(counts)))
+    elif counts:
+        count = counts.pop()
+        missing = [i for i in range(1, count + 1) if i not in shards]
+        if missing:
+            problems.append('Missing shards: %s' % ', '.join(
+                '%d/%d' % (i, count) for i in missing))
+    entries.sort(key=lambda e: (e['problem'], e['solution'], e['test']))
+    return entries, problems
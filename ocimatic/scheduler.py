@@ -0,0 +1,175 @@
+"""Pipelined build and execution of `run` and `check`.
+
+Every solution of every problem is built in a thread pool, after the
+dependencies it shares with other solutions (graders) are built once. Tests
+of a solution start the moment its build finishes, while the remaining
+builds continue in the background, so compiling and running overlap.
+
+Tests are judged one at a time by the calling thread so timings aren't
+disturbed by other tests. Solutions are judged in the order their builds
+finish, but results are reported in the usual order: the solution next in
+line streams its results, the others are held until their turn.
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from concurrent.futures import FIRST_COMPLETED
+
+from .core import TaskResult
+
+
+class Pipeline:
+    def __init__(self, jobs=None):
+        self._jobs = jobs
+
+    def _build(self, solution):
+        if not solution.need_rebuilt():
+            return True
+        return solution.build()
+
+    def _submit_after(self, executor, deps, fn, *args):
+        """Submit `fn(*args)` once all futures in `deps` finished
+        successfully. If some of them failed `fn` isn't called and the
+        returned future's result is False."""
+        if not deps:
+            return executor.submit(fn, *args)
+        future = Future()
+        remaining = [len(deps)]
+        lock = threading.Lock()
+
+        def chain(inner):
+            if inner.exception():
+                future.set_exception(inner.exception())
+            else:
+                future.set_result(inner.result())
+
+        def ready(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if all(not dep.exception() and dep.result() for dep in deps):
+                executor.submit(fn, *args).add_done_callback(chain)
+            else:
+                future.set_result(False)
+
+        for dep in deps:
+            dep.add_done_callback(ready)
+        return future
+
+    def _schedule(self, executor, units):
+        """Submit the build of each solution in `units` after its
+        dependencies.
+        Returns:
+          (list of Future) one per unit.
+        """
+        deps = {}
+        builds = []
+        for _, solution in units:
+            for dep in solution.dependencies():
+                if id(dep) not in deps:
+                    deps[id(dep)] = executor.submit(dep.build)
+            builds.append(self._submit_after(
+                executor, [deps[id(dep)] for dep in solution.dependencies()],
+                self._build, solution))
+        return builds
+
+    def run(self, problems, solution_callback, start_callback, end_callback,
+            partial, sample, formatter, status_fun, skips=None):
+        """Run solutions of `problems` on their tests, except the ones in
+        `skips[problem]`. `solution_callback` receives the problem and the
+        solution label.
+        Returns:
+          (dict of Problem to dict of TestData to bool) whether all solutions
+        succeeded on each test that was run, as `Problem.run`.
+        """
+        skips = skips or {}
+        tests = {}
+        passed = {}
+        units = []
+        segments = []
+        for problem in problems:
+            skip = skips.get(problem, ())
+            tests[problem] = [test for test in problem.tests(sample)
+                              if test not in skip]
+            passed[problem] = dict((test, True) for test in tests[problem])
+            for solution in problem.solutions(partial):
+                if not any(problem.selected(solution, test)
+                           for test in tests[problem]):
+                    continue
+                segments.append(('unit', len(units)))
+                units.append((problem, solution))
+            segments.append(('skip', problem))
+
+        reports = [None] * len(units)
+        emitted = [0]
+
+        def emit():
+            """Report every finished segment up to the first pending one."""
+            while emitted[0] < len(segments):
+                kind, value = segments[emitted[0]]
+                if kind == 'unit':
+                    if reports[value] is None:
+                        return
+                    problem, solution = units[value]
+                    solution_callback(problem, problem.solution_label(solution))
+                    for test, result in reports[value]:
+                        start_callback(str(test))
+                        end_callback(result)
+                elif skips.get(value):
+                    start_callback('Unchanged tests')
+                    end_callback(TaskResult('%d skipped' % len(skips[value])))
+                emitted[0] += 1
+
+        try:
+            with ThreadPoolExecutor(self._jobs) as executor:
+                builds = self._schedule(executor, units)
+                pending = list(range(len(units)))
+                emit()
+                while pending:
+                    ready = [i for i in pending if builds[i].done()]
+                    if not ready:
+                        wait([builds[i] for i in pending],
+                             return_when=FIRST_COMPLETED)
+                        continue
+                    i = ready[0]
+                    pending.remove(i)
+                    stream = segments[emitted[0]] == ('unit', i)
+                    reports[i] = self._judge(units[i], builds[i], tests,
+                                             passed, formatter, status_fun,
+                                             stream, solution_callback,
+                                             start_callback, end_callback)
+                    if stream:
+                        emitted[0] += 1
+                    emit()
+                emit()
+        finally:
+            for problem in problems:
+                problem.checker().close()
+        return passed
+
+    def _judge(self, unit, build, tests, passed, formatter, status_fun,
+               stream, solution_callback, start_callback, end_callback):
+        """Judge a built solution on the tests of its problem. If `stream` is
+        true results are reported as they come and an empty list is
+        returned, otherwise they are returned to be reported later."""
+        problem, solution = unit
+        built = not build.exception() and build.result()
+        if stream:
+            solution_callback(problem, problem.solution_label(solution))
+        results = []
+        for test in tests[problem]:
+            if not problem.selected(solution, test):
+                continue
+            if stream:
+                start_callback(str(test))
+            if built:
+                result = problem.judge(solution, test, formatter, status_fun)
+            else:
+                result = TaskResult('Build failed', False)
+                problem.report(solution, test, result)
+            passed[problem][test] = passed[problem][test] and result.status
+            if stream:
+                end_callback(result)
+            else:
+                results.append((test, result))
+        return results
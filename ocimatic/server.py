@@ -0,0 +1,238 @@
+"""Resident ocimatic server.
+
+The server keeps the contest model (``Contest`` and ``Problem`` objects) in
+memory and executes commands received over a Unix socket located at the
+contest root. Commands are executed one at a time, exactly as `cli.main`
+would, but without paying interpreter startup and model loading on every
+call. The client hands its own stdout and stderr to the server (SCM_RIGHTS),
+so output is streamed directly to the caller's terminal.
+"""
+import os
+import sys
+import json
+import socket
+from glob import glob
+
+SOCKET_NAME = '.ocimatic.sock'
+MAX_FDS = 2
+
+
+def socket_path(contest_path):
+    return os.path.join(contest_path, SOCKET_NAME)
+
+
+def find_contest_root(path):
+    """Return the contest root containing `path` or None. Unlike
+    `cli.change_directory` this never changes the working directory."""
+    path = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(path, '.ocimatic')):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _send_msg(conn, msg, fds=()):
+    data = (json.dumps(msg) + '\n').encode()
+    if fds:
+        socket.send_fds(conn, [data], list(fds))
+    else:
+        conn.sendall(data)
+
+
+def _recv_msg(conn):
+    data, fds, _, _ = socket.recv_fds(conn, 1 << 16, MAX_FDS)
+    while data and not data.endswith(b'\n'):
+        chunk = conn.recv(1 << 16)
+        if not chunk:
+            break
+        data += chunk
+    if not data:
+        return None, fds
+    return json.loads(data.decode()), fds
+
+
+def forward(argv, cwd=None):
+    """Run a command in the server listening for the contest containing `cwd`.
+    Returns the exit status of the command or None if no server is running.
+    """
+    contest_path = find_contest_root(cwd or os.getcwd())
+    if not contest_path or not os.path.exists(socket_path(contest_path)):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path(contest_path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Stale socket left by a server that didn't shut down cleanly.
+        conn.close()
+        return None
+    with conn:
+        sys.stdout.flush()
+        _send_msg(conn,
+                  {'op': 'run', 'cwd': cwd or os.getcwd(), 'argv': argv},
+                  [sys.stdout.fileno(), sys.stderr.fileno()])
+        reply, _ = _recv_msg(conn)
+    if reply is None:
+        return 1
+    return reply['status']
+
+
+def stop(contest_path):
+    """Ask the server running for `contest_path` to exit. Returns whether a
+    server was running."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path(contest_path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+    with conn:
+        _send_msg(conn, {'op': 'stop'})
+        _recv_msg(conn)
+    return True
+
+
+class ModelCache:
+    """Memoize `Contest` and `Problem` objects. An entry is reused as long as
+    the directories that were globbed to build it are unchanged, so adding a
+    solution or a test is picked up by the next command."""
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, cls, path, *args):
+        key = (cls.__name__, os.path.normpath(path)) + args
+        stamp = self._fingerprint(path)
+        entry = self._entries.get(key)
+        if entry and entry[0] == stamp:
+            return entry[1]
+        obj = cls(path, *args)
+        self._entries[key] = (stamp, obj)
+        return obj
+
+    def _fingerprint(self, path):
+        paths = [path]
+        paths += glob(os.path.join(path, '*'))
+        paths += glob(os.path.join(path, '*', '*'))
+        paths += glob(os.path.join(path, '*', '*', '*'))
+        stamp = []
+        for p in sorted(paths):
+            try:
+                st = os.stat(p)
+            except FileNotFoundError:
+                continue
+            stamp.append((p, st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+
+class Server:
+    def __init__(self, contest_path):
+        self._contest_path = contest_path
+        self._socket_path = socket_path(contest_path)
+        self._cache = ModelCache()
+
+    def serve(self):
+        from . import cli
+
+        if os.path.exists(self._socket_path):
+            if stop(self._contest_path):
+                raise RuntimeError('A server is already running.')
+            os.unlink(self._socket_path)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self._socket_path)
+        listener.listen(8)
+        cli.MODEL_CACHE = self._cache
+        try:
+            running = True
+            while running:
+                conn, _ = listener.accept()
+                with conn:
+                    running = self._handle(conn)
+        finally:
+            cli.MODEL_CACHE = None
+            listener.close()
+            if os.path.exists(self._socket_path):
+                os.unlink(self._socket_path)
+
+    def _handle(self, conn):
+        try:
+            msg, fds = _recv_msg(conn)
+        except (OSError, ValueError):
+            return True
+        if msg is None:
+            return True
+        if msg['op'] == 'stop':
+            _send_msg(conn, {'status': 0})
+            return False
+        if msg['op'] != 'run' or len(fds) != 2:
+            for fd in fds:
+                os.close(fd)
+            _send_msg(conn, {'status': 1})
+            return True
+        status = self._run(msg['cwd'], msg['argv'], fds[0], fds[1])
+        try:
+            _send_msg(conn, {'status': status})
+        except OSError:
+            pass
+        return True
+
+    def _run(self, cwd, argv, out_fd, err_fd):
+        """Execute a command with the client's stdout/stderr installed as
+        our own file descriptors 1 and 2, so child processes (compilers,
+        solutions) write to the client as well."""
+        from . import cli
+
+        saved_cwd = os.getcwd()
+        saved_env = dict(os.environ)
+        saved_opts = dict(cli.OPTS)
+        saved_stdout, saved_stderr = sys.stdout, sys.stderr
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved_fds = (os.dup(1), os.dup(2))
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        os.close(out_fd)
+        os.close(err_fd)
+        sys.stdout = open(1, 'w', closefd=False, buffering=1)
+        sys.stderr = open(2, 'w', closefd=False, buffering=1)
+        status = 0
+        try:
+            os.chdir(cwd)
+            cli.run(argv)
+        except SystemExit as exc:
+            if exc.code is None:
+                status = 0
+            elif isinstance(exc.code, int):
+                status = exc.code
+            else:
+                status = 1
+        except BrokenPipeError:
+            # The client closed its output (e.g. piped into `head`) or was
+            # interrupted: that's the end of the command.
+            status = 1
+        except Exception as exc:
+            try:
+                sys.stdout.write('ocimatic: %s\n' % exc)
+            except OSError:
+                pass
+            status = 1
+        finally:
+            for stream in (sys.stdout, sys.stderr):
+                try:
+                    # Only flushes, the descriptors are restored below.
+                    stream.close()
+                except OSError:
+                    pass
+            sys.stdout, sys.stderr = saved_stdout, saved_stderr
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            os.close(saved_fds[0])
+            os.close(saved_fds[1])
+            os.chdir(saved_cwd)
+            os.environ.clear()
+            os.environ.update(saved_env)
+            cli.OPTS.clear()
+            cli.OPTS.update(saved_opts)
+        return status
@@ -1,9 +1,19 @@
 import os
-from tempfile import NamedTemporaryFile
+import sys
+import time
+import shutil
+import signal
+import hashlib
+import resource
+import threading
+from glob import glob
+from tempfile import NamedTemporaryFile, TemporaryFile
 import subprocess
 
+from . import trace
 
-def make_solution_from_file_path(file_path, managers_path):
+
+def make_solution_from_file_path(file_path, managers_path, python='python3'):
     basename_path, ext = os.path.splitext(file_path)
     if ext == CppSolution.src_ext:
         return CppSolution(basename_path, managers_path)
@@ -11,28 +21,493 @@ def make_solution_from_file_path(file_path, managers_path):
         return CSolution(basename_path, managers_path)
     if ext == JavaSolution.src_ext:
         return JavaSolution(basename_path, managers_path)
+    if ext == PythonSolution.src_ext:
+        return PythonSolution(basename_path, managers_path, python)
     else:
         return None
 
 
-def run(cmd, in_path, out_path, *args):
+class Usage:
+    """Resources used by a finished process. `memory` is the peak resident set
+    size in bytes, or None if it isn't known (see `wait`), and
+    `memory_exceeded` tells whether the process went over
+    its memory limit, either by using more memory than the limit or by
+    failing to allocate it. `output_exceeded` tells whether it was killed
+    for writing more than its output limit, and `matches` whether its output
+    was equal to the expected one when they were compared while it ran (None
+    if they weren't)."""
+
+    def __init__(self, status, time, memory=0, memory_exceeded=False,
+                 output_exceeded=False, matches=None):
+        self.status = status
+        self.time = time
+        self.memory = memory
+        self.memory_exceeded = memory_exceeded
+        self.output_exceeded = output_exceeded
+        self.matches = matches
+
+
+# Last words of runtimes that failed to allocate memory.
+OUT_OF_MEMORY_MARKERS = [b'std::bad_alloc', b'MemoryError',
+                         b'java.lang.OutOfMemoryError']
+
+
+def run(cmd, in_path, out_path, *args, memory_limit=None, output_limit=None,
+        expected=None):
+    """Run `cmd` with standard input from `in_path` and standard output to
+    `out_path`, which may also be open file descriptors. If `in_path` is a
+    bytes-like object, or a file object returned by `preload`, it's written
+    to the standard input of the process through a pipe. If `memory_limit`
+    (bytes)
+    is given the data segment of the process is limited to it. If
+    `output_limit` (bytes) or `expected` are given see `run_bounded`.
+    Returns:
+      (Usage)
+    """
+    if output_limit is not None or expected is not None:
+        return run_bounded(cmd, in_path, out_path, *args,
+                           memory_limit=memory_limit,
+                           output_limit=output_limit, expected=expected)
+    with trace.span('run', 'process', cmd=cmd) as span, \
+            _stderr_file(memory_limit) as err_file:
+        if in_path is not None and not isinstance(in_path, (str, int)):
+            pid = _spawn_with_input(cmd, in_path, out_path, *args,
+                                    stderr=err_file, memory_limit=memory_limit)
+        else:
+            pid = spawn(cmd, in_path, out_path, *args, stderr=err_file,
+                        memory_limit=memory_limit)
+        waited = wait(pid)
+        usage = _usage(waited, err_file, memory_limit)
+        span.set(child_pid=pid, exit_code=waited[2], memory=usage.memory)
+    return usage
+
+
+def run_bounded(cmd, in_path, out_path, *args, memory_limit=None,
+                output_limit=None, expected=None):
+    """Same as `run`, but the standard output of the process goes through a
+    pipe and is copied to `out_path` by this process. The process is killed
+    as soon as it writes more than `output_limit` bytes. If `expected`, a
+    binary file object, is given the output is compared with it while it's
+    written, and the process is killed at the first difference.
+    Returns:
+      (Usage)
+    """
+    with trace.span('run', 'process', cmd=cmd) as span, \
+            _stderr_file(memory_limit) as err_file:
+        feeder = None
+        stdin = in_path
+        if in_path is not None and not isinstance(in_path, (str, int)):
+            # Input is written from another thread, since this one reads the
+            # output.
+            stdin, in_write_fd = os.pipe()
+            feeder = threading.Thread(target=_feed,
+                                      args=(in_write_fd, in_path))
+        read_fd, write_fd = os.pipe()
+        try:
+            pid = spawn(cmd, stdin, write_fd, *args, stderr=err_file,
+                        memory_limit=memory_limit)
+        finally:
+            os.close(write_fd)
+            if feeder:
+                os.close(stdin)
+        if feeder:
+            feeder.start()
+        exceeded, matches, killed = _drain(pid, read_fd, out_path,
+                                           output_limit, expected)
+        waited = wait(pid)
+        if feeder:
+            feeder.join()
+        usage = _usage(waited, err_file, memory_limit)
+        usage.output_exceeded = exceeded
+        usage.matches = matches
+        if exceeded:
+            usage.status = False
+        elif killed:
+            # Killed on purpose, the verdict is given by the comparison.
+            usage.status = not usage.memory_exceeded
+        span.set(child_pid=pid, exit_code=waited[2], memory=usage.memory,
+                 output_exceeded=exceeded, matches=matches)
+    return usage
+
+
+def _drain(pid, read_fd, out_path, output_limit, expected):
+    """Copy the output of the process `pid` from the pipe `read_fd` to
+    `out_path`, killing the process if it goes over `output_limit` or
+    differs from `expected`.
+    Returns:
+      (bool, bool, bool) whether the limit was exceeded, whether the output
+      matched `expected` (None without `expected`), and whether the process
+      was killed. A difference found once the output ended doesn't kill the
+      process, which may have failed on its own.
+    """
+    written = 0
+    exceeded = False
+    matches = None if expected is None else True
+    killed = False
+    with open(read_fd, 'rb', buffering=0) as pipe, \
+            open(out_path, 'wb',
+                 closefd=not isinstance(out_path, int)) as out_file:
+        for chunk in iter(lambda: pipe.read(1 << 16), b''):
+            written += len(chunk)
+            if output_limit is not None and written > output_limit:
+                exceeded = True
+            else:
+                out_file.write(chunk)
+                if expected is not None and \
+                   expected.read(len(chunk)) != chunk:
+                    matches = False
+            if exceeded or matches is False:
+                # The process hasn't been waited for, so `pid` is still
+                # ours even if it already exited.
+                os.kill(pid, signal.SIGKILL)
+                killed = True
+                break
+        else:
+            if expected is not None and expected.read(1):
+                matches = False
+    return exceeded, matches, killed
+
+
+def _stderr_file(memory_limit):
+    """Standard error of a process is only kept when a memory limit is set, to
+    tell allocation failures from other errors."""
+    if memory_limit is None:
+        return open('/dev/null', 'w')
+    return NamedTemporaryFile()
+
+
+def _usage(waited, err_file, memory_limit):
+    status, wtime, _, memory = waited
+    exceeded = False
+    if memory_limit is not None:
+        exceeded = memory is not None and memory > memory_limit
+        if not status and not exceeded:
+            err_file.seek(0, os.SEEK_END)
+            err_file.seek(max(err_file.tell() - 4096, 0))
+            tail = err_file.read()
+            exceeded = any(marker in tail for marker in OUT_OF_MEMORY_MARKERS)
+    return Usage(status and not exceeded, wtime, memory, exceeded)
+
+
+def preload(file_path):
+    """Load a file in memory to feed it to several processes with `run`. The
+    content is kept in an anonymous in-memory file (memfd) that isn't mapped
+    in this process: processes started directly inherit the resident memory
+    of ocimatic in their measured peak memory (see `wait`), so it must stay
+    small. Where memfd isn't
+    available a temporary file is used.
+    Returns:
+      (file object)
+    """
+    if hasattr(os, 'memfd_create'):
+        buffer_file = open(os.memfd_create('ocimatic-input'), 'w+b')
+    else:
+        buffer_file = TemporaryFile()
+    with open(file_path, 'rb') as in_file:
+        shutil.copyfileobj(in_file, buffer_file)
+    buffer_file.flush()
+    return buffer_file
+
+
+def _spawn_with_input(cmd, data, out_path, *args, **kwargs):
+    read_fd, write_fd = os.pipe()
+    try:
+        pid = spawn(cmd, read_fd, out_path, *args, **kwargs)
+    finally:
+        os.close(read_fd)
+    _feed(write_fd, data)
+    return pid
+
+
+def _feed(write_fd, data):
+    """Write `data` (see `run`) to the pipe `write_fd` and close it."""
+    with open(write_fd, 'wb') as pipe:
+        try:
+            if hasattr(data, 'fileno'):
+                offset = 0
+                for chunk in iter(lambda: os.pread(data.fileno(), 1 << 20,
+                                                   offset), b''):
+                    pipe.write(chunk)
+                    offset += len(chunk)
+            else:
+                pipe.write(data)
+        except BrokenPipeError:
+            # The process exited without reading its whole input.
+            pass
+
+
+# Python ignores these signals and ignored signals are inherited, but
+# processes expect their default action, e.g. to die writing to a closed pipe.
+RESTORED_SIGNALS = [getattr(signal, name) for name in ('SIGPIPE', 'SIGXFSZ')
+                    if hasattr(signal, name)]
+
+
+def spawn(cmd, stdin, stdout, *args, stderr=None, memory_limit=None):
+    """Start `cmd` in a child process and return its pid. `stdin` and `stdout`
+    may be a file path, an open file descriptor or None (stdin only).
+    Standard error goes to the file object `stderr`, or is discarded. The
+    size of the data segment (heap and private mappings) is limited to
+    `memory_limit` bytes if given.
+
+    The process is started with posix_spawn, which doesn't copy this
+    process, so the cost of a launch doesn't grow with the memory used by
+    ocimatic. It goes through the launcher (see `launcher_path`), which sets
+    the limit before executing `cmd`, since posix_spawn can't, and measures
+    the peak memory of `cmd` alone. Without the launcher `cmd` is spawned
+    directly, or with `fork_spawn` if there's a memory limit. `fork_spawn` is
+    also used where posix_spawn isn't available or fails (e.g. a missing
+    input)."""
+    launcher = launcher_path()
+    if not hasattr(os, 'posix_spawn') or \
+       (memory_limit is not None and launcher is None):
+        return fork_spawn(cmd, stdin, stdout, *args, stderr=stderr,
+                          memory_limit=memory_limit)
+    actions = []
+    if isinstance(stdin, int):
+        actions.append((os.POSIX_SPAWN_DUP2, stdin, 0))
+    elif stdin:
+        actions.append((os.POSIX_SPAWN_OPEN, 0, stdin, os.O_RDONLY, 0))
+    if isinstance(stdout, int):
+        actions.append((os.POSIX_SPAWN_DUP2, stdout, 1))
+    else:
+        actions.append((os.POSIX_SPAWN_OPEN, 1, stdout,
+                        os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666))
+    if stderr is not None:
+        actions.append((os.POSIX_SPAWN_DUP2, stderr.fileno(), 2))
+    else:
+        actions.append((os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0))
+    argv = [cmd] + list(args)
+    report_fd = None
+    if launcher is not None:
+        report_fd, write_fd = _report_pipe()
+        actions.append((os.POSIX_SPAWN_DUP2, write_fd, 3))
+        argv = [launcher, str(memory_limit or 0)] + argv
+    try:
+        pid = os.posix_spawn(argv[0], argv, os.environ, file_actions=actions,
+                             setsigdef=RESTORED_SIGNALS)
+    except OSError:
+        if report_fd is not None:
+            os.close(report_fd)
+        return fork_spawn(cmd, stdin, stdout, *args, stderr=stderr,
+                          memory_limit=memory_limit)
+    finally:
+        if report_fd is not None:
+            os.close(write_fd)
+    if report_fd is not None:
+        with _reports_lock:
+            _reports[pid] = report_fd
+    return pid
+
+
+LAUNCHER_SOURCE = os.path.join(os.path.dirname(__file__), 'resources',
+                               'launcher.c')
+
+_launcher = None
+_launcher_lock = threading.Lock()
+
+# Pid of a launcher -> read end of the pipe it reports the usage of its
+# child to.
+_reports = {}
+_reports_lock = threading.Lock()
+
+
+def launcher_path():
+    """Path of the launcher (resources/launcher.c), a small program that runs
+    a command with a memory limit set before it starts and reports the
+    resources it used. It's compiled the first time it's needed and kept in
+    ~/.cache/ocimatic.
+    Returns:
+      (string) or None if it can't be compiled.
+    """
+    global _launcher
+    with _launcher_lock:
+        if _launcher is None:
+            _launcher = _build_launcher() or ''
+        return _launcher or None
+
+
+def _build_launcher():
+    compiler = shutil.which('cc') or shutil.which('gcc')
+    if compiler is None:
+        return None
+    try:
+        with open(LAUNCHER_SOURCE, 'rb') as source_file:
+            digest = hashlib.sha1(source_file.read()).hexdigest()[:12]
+        cache_path = os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                                 os.path.expanduser('~/.cache')),
+                                  'ocimatic')
+        launcher = os.path.join(cache_path, 'launcher-%s' % digest)
+        if os.access(launcher, os.X_OK):
+            return launcher
+        os.makedirs(cache_path, exist_ok=True)
+        tmp_path = '%s.%d.tmp' % (launcher, os.getpid())
+        if subprocess.call([compiler, '-O2', '-o', tmp_path, LAUNCHER_SOURCE],
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL) != 0:
+            return None
+        os.replace(tmp_path, launcher)
+        return launcher
+    except OSError:
+        return None
+
+
+def _report_pipe():
+    """A pipe for the report of a launcher. The write end is duplicated to
+    descriptor 3 of the launcher, so it must not be 3 already: dup2 onto
+    itself would leave it closed on exec."""
+    read_fd, write_fd = os.pipe()
+    if write_fd == 3:
+        write_fd = os.dup(3)
+        os.close(3)
+    return read_fd, write_fd
+
+
+def fork_spawn(cmd, stdin, stdout, *args, stderr=None, memory_limit=None):
+    """Same as `spawn`, forking this process and redirecting files in the
+    child before executing `cmd`."""
     pid = os.fork()
     if pid == 0:
-        if in_path:
-            with open(in_path, 'r') as in_file:
-                os.dup2(in_file.fileno(), 0)
-        with open(out_path, 'w') as out_file:
-            os.dup2(out_file.fileno(), 1)
-        with open('/dev/null', 'w') as err_file:
-            os.dup2(err_file.fileno(), 2)
-        os.execl(cmd, cmd, *args)
+        try:
+            if isinstance(stdin, int):
+                os.dup2(stdin, 0)
+            elif stdin:
+                with open(stdin, 'r') as in_file:
+                    os.dup2(in_file.fileno(), 0)
+            if isinstance(stdout, int):
+                os.dup2(stdout, 1)
+            else:
+                with open(stdout, 'w') as out_file:
+                    os.dup2(out_file.fileno(), 1)
+            if stderr is not None:
+                os.dup2(stderr.fileno(), 2)
+            else:
+                with open('/dev/null', 'w') as err_file:
+                    os.dup2(err_file.fileno(), 2)
+            if memory_limit is not None:
+                resource.setrlimit(resource.RLIMIT_DATA,
+                                   (memory_limit, memory_limit))
+            for signum in RESTORED_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            os.execl(cmd, cmd, *args)
+        finally:
+            os._exit(127)
+    return pid
+
+
+def wait(pid):
+    """Wait for the child `pid`. Returns (status, time, exit_code, memory)
+    where time is the CPU time used by the child and memory its peak resident
+    set size in bytes. A child killed by a signal has a negative exit code.
+    For a child started through the launcher, these are the ones of the
+    command it ran; if the launcher itself was killed, its exit code is
+    returned.
+
+    Linux accounts the peak resident size of the process that started the
+    child in the memory of the child, so the memory of a child started
+    directly never reads below the resident memory of ocimatic itself
+    (about 20 MB). memory is None when it isn't known to be the child's
+    own: it wasn't started through the launcher, which is itself small,
+    and its peak isn't above the one of ocimatic."""
     (pid, status, rusage) = os.wait4(pid, 0)
-    status = os.WEXITSTATUS(status) == 0
     wtime = rusage.ru_utime + rusage.ru_stime
-    return status, wtime
+    maxrss = rusage.ru_maxrss
+    with _reports_lock:
+        report_fd = _reports.pop(pid, None)
+    if report_fd is not None:
+        with open(report_fd, 'rb') as report_file:
+            report = report_file.read().split()
+        maxrss = None
+        if len(report) == 4 and os.waitstatus_to_exitcode(status) == 0:
+            status = int(report[0])
+            wtime = float(report[1]) + float(report[2])
+            maxrss = int(report[3])
+    elif maxrss <= resource.getrusage(resource.RUSAGE_SELF).ru_maxrss:
+        maxrss = None
+    exit_code = os.waitstatus_to_exitcode(status)
+    memory = None
+    if maxrss is not None:
+        memory = maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return exit_code == 0, wtime, exit_code, memory
+
+
+def run_interactive(cmd, args, interactor_cmd, interactor_args,
+                    memory_limit=None):
+    """Run `cmd` connected through pipes to `interactor_cmd`: the standard
+    output of each process is the standard input of the other. The memory
+    limit only applies to `cmd`. Returns a `Usage` for the solution and for
+    the interactor separately. A solution killed by SIGPIPE after the
+    interactor exited successfully isn't considered to have failed."""
+    with trace.span('run', 'process', cmd=cmd, interactor=interactor_cmd) \
+            as span, _stderr_file(memory_limit) as err_file:
+        to_solution_r, to_solution_w = os.pipe()
+        to_interactor_r, to_interactor_w = os.pipe()
+        try:
+            pid = spawn(cmd, to_solution_r, to_interactor_w, *args,
+                        stderr=err_file, memory_limit=memory_limit)
+            interactor_pid = spawn(interactor_cmd, to_interactor_r,
+                                   to_solution_w, *interactor_args)
+        finally:
+            # Only the children must hold the pipes, otherwise no one gets EOF.
+            for fd in (to_solution_r, to_solution_w,
+                       to_interactor_r, to_interactor_w):
+                os.close(fd)
+        waited = wait(pid)
+        iwaited = wait(interactor_pid)
+        usage = _usage(waited, err_file, memory_limit)
+        iusage = _usage(iwaited, None, None)
+        if waited[2] == -signal.SIGPIPE and iusage.status and \
+           not usage.memory_exceeded:
+            # The interactor finished and closed its end while the solution
+            # was still writing: the score it gave decides.
+            usage.status = True
+        span.set(child_pid=pid, exit_code=waited[2], memory=usage.memory,
+                 interactor_pid=interactor_pid, interactor_exit_code=iwaited[2],
+                 interactor_time=iusage.time)
+    return usage, iusage
+
+
+def launch_overhead(spawner=spawn, launches=200):
+    """Measure the average wall time in seconds of starting `true` with
+    `spawner` (`spawn` or `fork_spawn`) and waiting for it."""
+    true_path = shutil.which('true')
+    start = time.perf_counter()
+    for _ in range(launches):
+        wait(spawner(true_path, None, os.devnull))
+    return (time.perf_counter() - start) / launches
+
+
+def pipe_round_trip(rounds=1000):
+    """Measure the average round-trip latency in seconds of a one line
+    message exchanged through pipes with another process. This is the cost
+    paid on each interaction with an interactor."""
+    process = subprocess.Popen(['cat'], stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, bufsize=0)
+    try:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            process.stdin.write(b'ping\n')
+            process.stdout.readline()
+        return (time.perf_counter() - start) / rounds
+    finally:
+        process.stdin.close()
+        process.wait()
+
 
 class Solution:
-    def run(self, in_path, out_path):
+    def run(self, in_path, out_path, *args, memory_limit=None,
+            output_limit=None, expected=None):
+        """See `run`.
+        Returns:
+          (Usage)
+        """
+        cmd = self.command(*args)
+        return run(cmd[0], in_path, out_path, *cmd[1:],
+                   memory_limit=memory_limit, output_limit=output_limit,
+                   expected=expected)
+
+    def command(self, *args):
+        """Return the command line executing the solution, building it first
+        if needed."""
         raise NotImplementedError("Method not implemented in child class.")
 
     def __str__(self):
@@ -41,9 +516,32 @@ class Solution:
     def isbuilt(self):
         raise NotImplementedError("Method not implemented in child class.")
 
+    def need_rebuilt(self):
+        return not self.isbuilt()
+
+    def dependencies(self):
+        """Objects with a `build` method that must be built before the
+        solution, like a grader shared with other solutions."""
+        return []
+
+    def source_path(self):
+        return self._src_path
+
     def build(self):
         raise NotImplementedError("Method not implemented in child class.")
 
+    def startup_time(self):
+        """Time spent starting the runtime on every run, which is not part of
+        the reported time."""
+        return 0.0
+
+    def artifact(self):
+        """Return (path, argv) describing a self-contained build product that
+        can be copied to another machine and executed there. In `argv` the
+        string '{}' stands for the path of the copy. Returns None if the
+        solution can't be moved."""
+        return None
+
 
 class CppSolution(Solution):
     src_ext = ".cpp"
@@ -55,42 +553,157 @@ class CppSolution(Solution):
         self._bin_path = basename_path + ".bin"
 
         self._managers_path = managers_path
-        self._use_grader = False
-        if os.path.exists(os.path.join(managers_path, self.grader_name)):
-            self._use_grader = True
-            self._grader_path = os.path.join(managers_path, self.grader_name)
+        self._grader = None
+        if managers_path and \
+           os.path.exists(os.path.join(managers_path, self.grader_name)):
+            self._grader = get_grader(managers_path)
 
     def __str__(self):
         return self._basename_path
 
-    def run(self, in_path, out_path):
+    def dependencies(self):
+        return [self._grader] if self._grader else []
+
+    def command(self, *args):
         if self.need_rebuilt():
             print("Rebuilt")
             self.build()
-        return Binary(self._bin_path).run(in_path, out_path)
+        return [self._bin_path] + list(args)
+
+    def artifact(self):
+        if self.need_rebuilt():
+            self.build()
+        return self._bin_path, ['{}']
 
     def isbuilt(self):
         return os.path.isfile(self._bin_path)
 
     def need_rebuilt(self):
-        if self.isbuilt():
-            bin_time = os.path.getmtime(self._bin_path)
-            src_time = os.path.getmtime(self._src_path)
-            return src_time > bin_time
-        return True
+        if not self._grader:
+            return not _is_newer(self._bin_path, [self._src_path])
+        # The grader's object may be stale too, so its sources are compared
+        # rather than the object alone.
+        return self._grader.need_rebuilt() or \
+            not _is_newer(self._bin_path, [self._src_path,
+                                           self._grader.obj_path()] +
+                          self._grader.sources())
 
     def build(self):
         grader = ''
-        if self._use_grader:
-            grader = '"'+self._grader_path+'"'
-        cmd_line = 'g++ -std=c++11 -O2 -I"%s" -o "%s" %s "%s"' % (
-            self._managers_path,
+        include = ''
+        if self._grader:
+            if not self._grader.build():
+                return False
+            grader = '"%s"' % self._grader.obj_path()
+            include = self._grader.include_flags()
+        elif self._managers_path:
+            include = '-I"%s"' % self._managers_path
+        cmd_line = 'g++ %s %s -o "%s" %s "%s"' % (
+            Grader.flags,
+            include,
             self._bin_path,
             grader,
             self._src_path)
+        with trace.span('build', 'build', solution=self) as span:
+            status = subprocess.call(cmd_line, shell=True) == 0
+            span.set(status=status)
+        return status
+
+
+_graders = {}
+_graders_lock = threading.Lock()
+
+
+def get_grader(managers_path):
+    """Return the `Grader` for `managers_path`, shared by all solutions of the
+    problem so it's built only once."""
+    managers_path = os.path.normpath(managers_path)
+    with _graders_lock:
+        if managers_path not in _graders:
+            _graders[managers_path] = Grader(managers_path)
+        return _graders[managers_path]
+
+
+class Grader:
+    """C++ grader in `managers/grader.cpp`. The grader is compiled once to an
+    object file and the headers in the managers directory are precompiled,
+    so each solution only compiles its own translation unit and links
+    against the grader. Build products go in `managers/.build`."""
+    flags = '-std=c++11 -O2'
+    src_name = 'grader.cpp'
+
+    def __init__(self, managers_path):
+        self._managers_path = managers_path
+        self._src_path = os.path.join(managers_path, self.src_name)
+        self._build_path = os.path.join(managers_path, '.build')
+        self._obj_path = os.path.join(self._build_path, 'grader.o')
+        self._lock = threading.Lock()
+
+    def obj_path(self):
+        return self._obj_path
+
+    def include_flags(self):
+        # GCC looks for `header.h.gch` in each include directory before the
+        # header itself, so the build directory must come first. If a
+        # precompiled header can't be used the plain header is included.
+        return '-I"%s" -I"%s"' % (self._build_path, self._managers_path)
+
+    def headers(self):
+        return sorted(glob(os.path.join(self._managers_path, '*.h')) +
+                      glob(os.path.join(self._managers_path, '*.hpp')))
+
+    def isbuilt(self):
+        return os.path.isfile(self._obj_path)
+
+    def sources(self):
+        return [self._src_path] + self.headers()
+
+    def need_rebuilt(self):
+        return not _is_newer(self._obj_path, self.sources())
+
+    def build(self):
+        with self._lock:
+            os.makedirs(self._build_path, exist_ok=True)
+            with trace.span('build', 'build', solution=self._src_path) as span:
+                for header in self.headers():
+                    self._build_pch(header)
+                status = self._build_obj()
+                span.set(status=status)
+            return status
+
+    def _build_pch(self, header_path):
+        """Precompiled headers are only an optimization, so failures (e.g.
+        headers that can't be compiled on their own) are silently ignored."""
+        pch_path = os.path.join(self._build_path,
+                                os.path.basename(header_path) + '.gch')
+        if _is_newer(pch_path, [header_path]):
+            return True
+        cmd_line = 'g++ %s -x c++-header "%s" -o "%s"' % (self.flags,
+                                                          header_path,
+                                                          pch_path)
+        with open('/dev/null', 'w') as null:
+            if subprocess.call(cmd_line, shell=True, stderr=null) != 0 and \
+               os.path.exists(pch_path):
+                os.remove(pch_path)
+
+    def _build_obj(self):
+        if not self.need_rebuilt():
+            return True
+        cmd_line = 'g++ %s %s -c "%s" -o "%s"' % (self.flags,
+                                                 self.include_flags(),
+                                                 self._src_path,
+                                                 self._obj_path)
         return subprocess.call(cmd_line, shell=True) == 0
 
 
+def _is_newer(target_path, dep_paths):
+    """Whether `target_path` exists and is newer than all `dep_paths`."""
+    if not os.path.isfile(target_path):
+        return False
+    target_time = os.path.getmtime(target_path)
+    return all(os.path.getmtime(dep) <= target_time for dep in dep_paths)
+
+
 class CSolution(Solution):
     src_ext = ".c"
     grader_name = "grader.c"
@@ -105,24 +718,36 @@ class CSolution(Solution):
     def __str__(self):
         return self._basename_path
 
-    def run(self, in_path, out_path):
+    def command(self, *args):
+        if not self.isbuilt():
+            self.build()
+        return [self._bin_path] + list(args)
+
+    def artifact(self):
         if not self.isbuilt():
             self.build()
-        return Binary(self._bin_path).run(in_path, out_path)
+        return self._bin_path, ['{}']
 
     def isbuilt(self):
         return os.path.isfile(self._bin_path)
 
+    def need_rebuilt(self):
+        return not _is_newer(self._bin_path, [self._src_path])
+
     def build(self):
-        bin_time = os.path.getmtime(self._bin_path)
-        src_time = os.path.getmtime(self._src_path)
-        if src_time <= bin_time:
+        if not self.need_rebuilt():
             return True
-        cmd_line = 'gcc -O2 -lm -std=c99 -I"%s" -o "%s" "%s"' % (
-                self._managers_path,
+        include = ''
+        if self._managers_path:
+            include = '-I"%s"' % self._managers_path
+        cmd_line = 'gcc -O2 -lm -std=c99 %s -o "%s" "%s"' % (
+                include,
                 self._bin_path,
                 self._src_path)
-        return subprocess.call(cmd_line, shell=True) == 0
+        with trace.span('build', 'build', solution=self) as span:
+            status = subprocess.call(cmd_line, shell=True) == 0
+            span.set(status=status)
+        return status
 
 class JavaSolution(Solution):
     src_ext = ".java"
@@ -141,12 +766,11 @@ class JavaSolution(Solution):
     def __str__(self):
         return os.path.join(self._class_path, self._class_name)
 
-    def run(self, in_path, out_path):
+    def command(self, *args):
         if self.need_rebuilt():
             self.build()
-        return run("/usr/bin/java", in_path, out_path,
-                   "-cp", self._class_path,
-                   self._class_name)
+        return ["/usr/bin/java", "-cp", self._class_path,
+                self._class_name] + list(args)
 
     def isbuilt(self):
         return os.path.isfile(self._bytecode_path)
@@ -160,7 +784,90 @@ class JavaSolution(Solution):
 
     def build(self):
         cmd_line = 'javac "%s"' % (self._src_path)
-        return subprocess.call(cmd_line, shell=True) == 0
+        with trace.span('build', 'build', solution=self) as span:
+            status = subprocess.call(cmd_line, shell=True) == 0
+            span.set(status=status)
+        return status
+
+class PythonSolution(Solution):
+    src_ext = ".py"
+    # Startup time of each interpreter, measured once per process.
+    startup_times = {}
+    startup_lock = threading.Lock()
+
+    def __init__(self, basename_path, managers_path, interpreter='python3'):
+        self._basename_path = basename_path
+        self._src_path = basename_path + self.src_ext
+        self._interpreter = interpreter
+        # Bytecode is interpreter specific so each gets its own file.
+        self._bytecode_path = '%s.%s.pyc' % (basename_path,
+                                             os.path.basename(interpreter))
+
+    def __str__(self):
+        return self._basename_path
+
+    def interpreter_path(self):
+        # core imports this module.
+        from .core import OcimaticException
+        interpreter_path = shutil.which(self._interpreter)
+        if not interpreter_path:
+            raise OcimaticException('Interpreter `%s` not found' %
+                                    self._interpreter)
+        return interpreter_path
+
+    def command(self, *args):
+        if self.need_rebuilt():
+            self.build()
+        return [self.interpreter_path(), self._bytecode_path] + list(args)
+
+    def artifact(self):
+        if self.need_rebuilt():
+            self.build()
+        return self._bytecode_path, [self._interpreter, '{}']
+
+    def run(self, in_path, out_path, *args, memory_limit=None,
+            output_limit=None, expected=None):
+        startup = self.startup_time()
+        usage = super(PythonSolution, self).run(in_path, out_path, *args,
+                                                memory_limit=memory_limit,
+                                                output_limit=output_limit,
+                                                expected=expected)
+        usage.time = max(usage.time - startup, 0.0)
+        return usage
+
+    def isbuilt(self):
+        return os.path.isfile(self._bytecode_path)
+
+    def need_rebuilt(self):
+        if self.isbuilt():
+            bytecode_time = os.path.getmtime(self._bytecode_path)
+            src_time = os.path.getmtime(self._src_path)
+            return src_time > bytecode_time
+        return True
+
+    def build(self):
+        cmd = [self.interpreter_path(), '-c',
+               'import sys, py_compile;'
+               'py_compile.compile(sys.argv[1], sys.argv[2], doraise=True)',
+               self._src_path, self._bytecode_path]
+        with trace.span('build', 'build', solution=self) as span:
+            status = subprocess.call(cmd) == 0
+            span.set(status=status)
+        return status
+
+    def startup_time(self, samples=5):
+        """CPU time of starting the interpreter and exiting, which is
+        subtracted from the time of every run. The minimum of a few samples is
+        taken to filter noise."""
+        interpreter_path = self.interpreter_path()
+        with self.startup_lock:
+            if interpreter_path not in self.startup_times:
+                with trace.span('startup', 'build', interpreter=interpreter_path):
+                    times = [run(interpreter_path, None, '/dev/null', '-c',
+                                 'pass').time for _ in range(samples)]
+                self.startup_times[interpreter_path] = min(times)
+            return self.startup_times[interpreter_path]
+
 
 class Binary:
     def __init__(self, file_path):
@@ -170,24 +877,120 @@ class Binary:
     def run(self, in_path, out_path, *args):
         return run(self._file_path, in_path, out_path, *args)
 
+    def file_path(self):
+        return self._file_path
+
 
-class DiffChecker:
+class Checker:
     def __call__(self, in_path, expected_path, out_path):
-        with open('/dev/null', 'w') as null:
+        raise NotImplementedError("Method not implemented in child class.")
+
+    def close(self):
+        pass
+
+
+class DiffChecker(Checker):
+    def __call__(self, in_path, expected_path, out_path):
+        with trace.span('check', 'check', checker='diff') as span, \
+                open('/dev/null', 'w') as null:
             status = subprocess.call(['diff',
                                       expected_path,
                                       out_path],
                                      stdout=null,
                                      stderr=null)
+            span.set(exit_code=status)
             return 1.0 if status == 0 else 0.0
 
 
-class CustomChecker:
+class CustomChecker(Checker):
     def __init__(self, file_path):
         self._binary = Binary(file_path)
 
+    def file_path(self):
+        return self._binary.file_path()
+
     def __call__(self, in_path, expected_path, out_path):
-        with NamedTemporaryFile() as tmp_file:
+        with trace.span('check', 'check', checker='custom'), \
+                NamedTemporaryFile() as tmp_file:
             tmp_path = tmp_file.name
             self._binary.run(None, tmp_path, in_path, expected_path, out_path)
             return float(tmp_file.read())
+
+
+class PersistentChecker(Checker):
+    """Custom checker started once and reused for every test. For each test
+    the checker reads three lines from stdin with the paths of the input,
+    the expected output and the solution output, and must answer with a
+    line containing the score. The process is restarted if it dies."""
+
+    def __init__(self, file_path):
+        assert os.path.isfile(file_path)
+        self._file_path = file_path
+        self._process = None
+        self._lock = threading.Lock()
+
+    def file_path(self):
+        return self._file_path
+
+    def __call__(self, in_path, expected_path, out_path):
+        with trace.span('check', 'check', checker='persistent'), self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._process = subprocess.Popen([self._file_path],
+                                                 stdin=subprocess.PIPE,
+                                                 stdout=subprocess.PIPE,
+                                                 stderr=subprocess.DEVNULL,
+                                                 universal_newlines=True,
+                                                 bufsize=1)
+            try:
+                self._process.stdin.write('%s\n%s\n%s\n' % (in_path,
+                                                              expected_path,
+                                                              out_path))
+                self._process.stdin.flush()
+                line = self._process.stdout.readline()
+            except BrokenPipeError:
+                line = ''
+            if not line:
+                self._kill()
+                raise Exception('Checker exited unexpectedly')
+            return float(line)
+
+    def close(self):
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                try:
+                    self._process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self._kill()
+                self._process = None
+
+    def _kill(self):
+        self._process.kill()
+        self._process.wait()
+        self._process = None
+
+
+class Interactor:
+    """Manager for interactive problems. It is called with the paths of the
+    test input, the expected output (which may not exist) and a file where it
+    must write the score. Its standard input and output are connected to the
+    solution."""
+
+    def __init__(self, file_path):
+        assert os.path.isfile(file_path)
+        self._file_path = file_path
+
+    def __call__(self, solution, in_path, expected_path, memory_limit=None):
+        """Returns (usage, outcome) where usage refers to the solution
+        alone. As in `Solution.run`, the startup time of the solution isn't
+        counted."""
+        cmd = solution.command()
+        startup = solution.startup_time()
+        with NamedTemporaryFile() as score_file:
+            usage, iusage = run_interactive(
+                cmd[0], cmd[1:], self._file_path,
+                [in_path, expected_path, score_file.name], memory_limit)
+            if not iusage.status:
+                raise Exception('Interactor failed')
+            usage.time = max(usage.time - startup, 0.0)
+            return usage, float(score_file.read())
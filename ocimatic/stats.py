@@ -0,0 +1,159 @@
+"""Statistics of test inputs.
+
+Each input is read once, as a stream, counting its bytes, lines and
+whitespace separated tokens, and keeping the minimum and maximum of the
+numeric tokens of each column. Columns are numbered within a line. The first
+line, which usually holds the sizes and parameters of a test, is kept apart
+from the other lines, so column "1:2" is the second token of the first line
+and "*:1" the first token of any other line. Only the first `MAX_COLUMNS`
+columns of a line are tracked.
+
+The statistics of a dataset are kept in an index next to its manifest,
+keyed by the hash of each input, so an input is only read again when its
+content changes.
+"""
+import os
+import json
+
+from .compression import open_file
+
+MAX_COLUMNS = 16
+
+
+def _number(token):
+    if token[:1] not in b'+-.0123456789':
+        return None
+    try:
+        return int(token)
+    except ValueError:
+        try:
+            return float(token)
+        except ValueError:
+            return None
+
+
+class TestStats:
+    def __init__(self, size=0, lines=0, tokens=0, columns=None):
+        self.size = size
+        self.lines = lines
+        self.tokens = tokens
+        # Column key -> [min, max]
+        self.columns = columns or {}
+
+    def to_json(self):
+        return {'size': self.size, 'lines': self.lines, 'tokens': self.tokens,
+                'columns': self.columns}
+
+    @staticmethod
+    def from_json(data):
+        return TestStats(data['size'], data['lines'], data['tokens'],
+                         data['columns'])
+
+
+def column_name(key):
+    line, column = key.split(':')
+    if line == '*':
+        return 'column %s of other lines' % column
+    return 'line %s, column %s' % (line, column)
+
+
+def scan(file_path):
+    """Compute the statistics of an input, decompressing it on the fly.
+    Returns:
+      (TestStats)
+    """
+    stats = TestStats()
+    columns = stats.columns
+    with open_file(file_path) as in_file:
+        for number, line in enumerate(in_file):
+            stats.size += len(line)
+            stats.lines += 1
+            tokens = line.split()
+            stats.tokens += len(tokens)
+            prefix = '1:' if number == 0 else '*:'
+            for i, token in enumerate(tokens[:MAX_COLUMNS]):
+                value = _number(token)
+                if value is None:
+                    continue
+                key = prefix + str(i + 1)
+                bounds = columns.get(key)
+                if bounds is None:
+                    columns[key] = [value, value]
+                elif value < bounds[0]:
+                    bounds[0] = value
+                elif value > bounds[1]:
+                    bounds[1] = value
+    return stats
+
+
+class StatsIndex:
+    file_name = '.ocimatic-stats.json'
+
+    def __init__(self, dir_path):
+        self._file_path = os.path.join(dir_path, self.file_name)
+        self._entries = {}
+        try:
+            with open(self._file_path, 'r') as index_file:
+                self._entries = json.load(index_file)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, input_hash):
+        """Cached statistics of the input with hash `input_hash`, or None."""
+        entry = self._entries.get(input_hash)
+        return TestStats.from_json(entry) if entry else None
+
+    def stats(self, file_path, input_hash):
+        """Statistics of `file_path`, scanning it if they aren't cached."""
+        if input_hash not in self._entries:
+            self._entries[input_hash] = scan(file_path).to_json()
+        return self.get(input_hash)
+
+    def save(self, input_hashes):
+        """Save the index keeping only the entries of `input_hashes`."""
+        self._entries = dict((h, e) for h, e in self._entries.items()
+                             if h in input_hashes)
+        tmp_path = self._file_path + '.tmp'
+        with open(tmp_path, 'w') as index_file:
+            json.dump(self._entries, index_file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self._file_path)
+
+
+def largest(tests, count=3):
+    """The `count` largest tests of each subtask.
+    Returns:
+      (list of (subtask, list of (TestData, TestStats)))
+    `tests` is a list of (subtask, TestData, TestStats).
+    """
+    groups = {}
+    for subtask, test, stats in tests:
+        groups.setdefault(subtask, []).append((test, stats))
+    return [(subtask, sorted(groups[subtask],
+                             key=lambda t: -t[1].size)[:count])
+            for subtask in sorted(groups)]
+
+
+def near_bounds(tests, margin=0.05):
+    """For each column, the tests whose minimum or maximum is within
+    `margin` (a fraction of the range of the column) of the minimum or
+    maximum of the whole dataset.
+    Returns:
+      (list of (key, min, list of TestData, max, list of TestData))
+    `tests` is a list of (TestData, TestStats).
+    """
+    bounds = {}
+    for _, stats in tests:
+        for key, (low, high) in stats.columns.items():
+            if key not in bounds:
+                bounds[key] = [low, high]
+            bounds[key] = [min(bounds[key][0], low), max(bounds[key][1], high)]
+    report = []
+    for key in sorted(bounds, key=lambda k: (k[0] == '*', int(k[2:]))):
+        low, high = bounds[key]
+        slack = (high - low) * margin
+        at_low = [test for test, stats in tests if key in stats.columns and
+                  stats.columns[key][0] <= low + slack]
+        at_high = [test for test, stats in tests if key in stats.columns and
+                   stats.columns[key][1] >= high - slack]
+        report.append((key, low, at_low, high, at_high))
+    return report
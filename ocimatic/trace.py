@@ -0,0 +1,101 @@
+"""Phase tracing in Chrome trace-event format.
+
+Tracing is disabled by default and `span` then returns a shared no-op
+object. Once `enable` is called every span is recorded as a complete ('X')
+event that can be loaded in chrome://tracing or Perfetto.
+"""
+import os
+import json
+import time
+import threading
+
+_events = None
+_origin = 0.0
+_lock = threading.Lock()
+
+
+def enable():
+    global _events, _origin
+    _events = []
+    _origin = time.perf_counter()
+
+
+def disable():
+    global _events
+    _events = None
+
+
+def enabled():
+    return _events is not None
+
+
+class _Span:
+    def __init__(self, name, cat, args):
+        self._name = name
+        self._cat = cat
+        self._args = args
+        self._start = None
+
+    def set(self, **args):
+        self._args.update(args)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self._args['error'] = str(exc)
+        event = {
+            'name': self._name,
+            'cat': self._cat,
+            'ph': 'X',
+            'ts': (self._start - _origin) * 1e6,
+            'dur': (end - self._start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': {k: str(v) for k, v in self._args.items()},
+        }
+        with _lock:
+            if _events is not None:
+                _events.append(event)
+        return False
+
+
+class _NullSpan:
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, cat='ocimatic', **args):
+    """Context manager recording the phase `name`. Attributes known only at
+    the end of the phase (e.g. exit status) can be added with `set`."""
+    if _events is None:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def dump(file_path):
+    with open(file_path, 'w') as trace_file:
+        json.dump({'traceEvents': _events or [],
+                   'displayTimeUnit': 'ms'}, trace_file)
+
+
+def summary(top=5):
+    """Return (name, count, total seconds) of the phases that took most time.
+    Nested spans are counted in full for each level."""
+    totals = {}
+    for event in _events or []:
+        count, total = totals.get(event['name'], (0, 0.0))
+        totals[event['name']] = (count + 1, total + event['dur'] / 1e6)
+    ranking = sorted(totals.items(), key=lambda item: -item[1][1])
+    return [(name, count, total) for name, (count, total) in ranking[:top]]